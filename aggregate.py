@@ -0,0 +1,220 @@
+"""Roll up saved cups reports into per-day, per-week and per-product totals.
+
+    python aggregate.py reports/ --jobs 4
+    python aggregate.py branch1/*.csv branch2/*.csv --json > march.json
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import load_catalog
+from reports import report_time
+
+
+CACHE_NAME = ".cups_aggregate_cache.json"
+# Bumped when parse_report changes what it returns for a file
+CACHE_VERSION = 2
+
+
+def find_reports(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "cups_report_*.csv")))
+        else:
+            found.extend(glob.glob(path) or [path])
+    return sorted(p for p in set(found) if report_time(p))
+
+
+def parse_report(path):
+    # Returns [[category, product, medio, grande, fixed, sale], ...] with blanks
+    # as 0, or None when the file cannot be read as a report at all
+    lines = []
+    try:
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader, None) or []
+            columns = {name.strip(): i for i, name in enumerate(header)}
+            if "Category" not in columns or "Product" not in columns:
+                return None
+            picks = [columns.get(name) for name in ("Medio", "Grande", "Fixed", "Sale")]
+            for row in reader:
+                if len(row) <= max(columns["Category"], columns["Product"]):
+                    continue
+                values = []
+                for col in picks:
+                    text = row[col].strip() if col is not None and col < len(row) else ""
+                    try:
+                        values.append(int(text) if text else 0)
+                    except ValueError:
+                        values.append(0)
+                if any(values):
+                    lines.append([row[columns["Category"]], row[columns["Product"]]] + values)
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return None
+    return lines
+
+
+class ReportCache:
+    # Parsed lines per report file, reused while the file's mtime and size are unchanged
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        if path:
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+                if data.get("version") == CACHE_VERSION:
+                    self.entries = data.get("files", {})
+            except (OSError, ValueError):
+                pass
+
+    def get(self, path):
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if entry["mtime"] != st.st_mtime_ns or entry["size"] != st.st_size:
+            return None
+        return entry["lines"]
+
+    def put(self, path, lines):
+        st = os.stat(path)
+        self.entries[os.path.abspath(path)] = {"mtime": st.st_mtime_ns, "size": st.st_size, "lines": lines}
+        self.dirty = True
+
+    def save(self):
+        if not self.path or not self.dirty:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"version": CACHE_VERSION, "files": self.entries}, file)
+        os.replace(tmp_path, self.path)
+
+
+def load_reports(paths, cache, jobs=1):
+    # Returns ({path: lines}, [paths that could not be read])
+    results = {}
+    skipped = []
+    missing = []
+    for path in paths:
+        lines = cache.get(path)
+        if lines is None:
+            missing.append(path)
+        else:
+            results[path] = lines
+    if jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            parsed = list(pool.map(parse_report, missing, chunksize=max(1, len(missing) // (jobs * 4))))
+    else:
+        parsed = [parse_report(path) for path in missing]
+    for path, lines in zip(missing, parsed):
+        if lines is None:
+            skipped.append(path)
+            continue
+        cache.put(path, lines)
+        results[path] = lines
+    return results, skipped
+
+
+def latest_per_day(paths, when=report_time):
+    # A saved report holds the running tally, so by default only the last save
+    # of each day in each directory counts. ``when`` reads the time off a file name.
+    latest = {}
+    for path in paths:
+        key = (os.path.dirname(os.path.abspath(path)), when(path).date())
+        if key not in latest or when(path) > when(latest[key]):
+            latest[key] = path
+    return sorted(latest.values())
+
+
+def aggregate(reports, catalog=None):
+    # Rows saved under old category or product names are counted under the current ones
+    if catalog is None:
+        catalog = load_catalog()
+    addons = {spec.name for spec in catalog.categories if spec.kind == "addons"}
+    aliases = catalog.aliases
+    days = defaultdict(lambda: [0, 0, 0])
+    weeks = defaultdict(lambda: [0, 0, 0])
+    products = defaultdict(lambda: [0, 0, 0, 0])
+    for path, lines in reports.items():
+        when = report_time(path)
+        day = when.strftime("%Y-%m-%d")
+        year, week, _ = when.isocalendar()
+        week = f"{year}-W{week:02d}"
+        for category, product, medio, grande, fixed, sale in lines:
+            category, product = aliases.get((category, product), (category, product))
+            cups = medio + grande + fixed
+            column = 1 if category in addons else 0
+            for totals in (days[day], weeks[week]):
+                totals[column] += cups
+                totals[2] += sale
+            p = products[(category, product)]
+            p[0] += medio
+            p[1] += grande
+            p[2] += fixed
+            p[3] += sale
+    return {
+        "days": {day: {"cups": t[0], "addons": t[1], "sales": t[2]} for day, t in sorted(days.items())},
+        "weeks": {week: {"cups": t[0], "addons": t[1], "sales": t[2]} for week, t in sorted(weeks.items())},
+        "products": [
+            {"category": category, "product": product, "medio": t[0], "grande": t[1], "fixed": t[2],
+             "cups": t[0] + t[1] + t[2], "sales": t[3]}
+            for (category, product), t in sorted(products.items())
+        ],
+    }
+
+
+def print_text(result, out):
+    for title, key in (("Per day", "days"), ("Per week", "weeks")):
+        out.write(f"{title}\n")
+        for period, t in result[key].items():
+            out.write(f"  {period:<12} cups {t['cups']:>6}  add-ons {t['addons']:>6}  sales ₱{t['sales']}\n")
+    out.write("Per product\n")
+    for t in result["products"]:
+        out.write(f"  {t['category']:<16} {t['product']:<10} medio {t['medio']:>5}  grande {t['grande']:>5}  "
+                  f"fixed {t['fixed']:>5}  sales ₱{t['sales']}\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate saved cups_report_*.csv files.")
+    parser.add_argument("paths", nargs="*", default=["."], help="report files, globs or directories")
+    parser.add_argument("--jobs", type=int, default=1, help="parse uncached files with this many processes")
+    parser.add_argument("--cache", default=None, help=f"cache file (default: {CACHE_NAME} in the current directory)")
+    parser.add_argument("--no-cache", action="store_true", help="parse every file and keep no cache")
+    parser.add_argument("--all-saves", action="store_true",
+                        help="sum every save instead of only the last one per day and directory")
+    parser.add_argument("--catalog", help="catalog file (default: the bundled catalog.json)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of text")
+    args = parser.parse_args(argv)
+
+    paths = find_reports(args.paths)
+    if not args.all_saves:
+        paths = latest_per_day(paths)
+    cache = ReportCache(None if args.no_cache else (args.cache or CACHE_NAME))
+    reports, skipped = load_reports(paths, cache, jobs=args.jobs)
+    cache.save()
+    for path in skipped:
+        sys.stderr.write(f"skipped {path}: not a readable report\n")
+
+    result = aggregate(reports, load_catalog(args.catalog))
+    result["files"] = len(reports)
+    result["skipped"] = skipped
+    if args.json:
+        json.dump(result, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        print_text(result, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Headless benchmarks for the tap, totals, save, load and startup paths.
+
+    python bench.py --output before.json
+    python bench.py --taps 20000 --menu-scale 10 --compare before.json
+
+Model benchmarks only need the standard library. The UI ones build the real
+widgets without opening a window and are skipped when Kivy is not installed.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from catalog import default_catalog
+from journal import Journal
+from model import CategorySpec, CountStore
+from reports import read_report, write_report
+
+
+def scaled_catalog(scale):
+    # Every category gets ``scale`` times as many products, with distinct names
+    if scale <= 1:
+        return default_catalog()
+    specs = []
+    for spec in default_catalog():
+        products = []
+        prices = {}
+        for i in range(scale):
+            for p in spec.products:
+                name = p if i == 0 else f"{p} {i}"
+                products.append(name)
+                if p in spec.fixed_prices:
+                    prices[name] = spec.fixed_prices[p]
+        specs.append(CategorySpec(spec.name, products, kind=spec.kind, price_medio=spec.price_medio,
+                                  price_grande=spec.price_grande, fixed_prices=prices))
+    return specs
+
+
+def tap_sequence(store, taps, seed=1):
+    rng = random.Random(seed)
+    size = len(store)
+    return [(rng.randrange(size), 1 if rng.random() < 0.85 else -1) for _ in range(taps)]
+
+
+def fill(store, seed=2):
+    rng = random.Random(seed)
+    store.load([rng.randrange(0, 40) for _ in range(len(store))])
+
+
+class Bench:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, fn, setup=None, ops=1):
+        # ``setup`` runs before every timed call and is not measured
+        times = []
+        for _ in range(self.repeat):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg)
+            times.append(time.perf_counter() - start)
+        arg = setup() if setup else None
+        tracemalloc.start()
+        fn(arg)
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        best = min(times)
+        result = {
+            "name": name,
+            "ops": ops,
+            "seconds": times,
+            "best": best,
+            "mean": sum(times) / len(times),
+            "best_per_op_us": best / ops * 1e6,
+            "alloc_peak_bytes": peak,
+            "alloc_retained_bytes": current,
+        }
+        self.results.append(result)
+        sys.stderr.write(f"{name:<24} best {best * 1e3:9.3f} ms  {result['best_per_op_us']:9.3f} us/op  "
+                         f"peak {peak / 1024:8.1f} KiB\n")
+        return result
+
+    def skip(self, name, reason):
+        self.results.append({"name": name, "skipped": reason})
+        sys.stderr.write(f"{name:<24} skipped: {reason}\n")
+
+
+def model_benchmarks(bench, catalog, taps, workdir):
+    store = CountStore(catalog)
+    seq = tap_sequence(store, taps)
+
+    def apply_taps(_):
+        apply = store.apply
+        for slot, delta in seq:
+            apply(slot, delta)
+
+    bench.run("model.taps", apply_taps, setup=store.reset, ops=taps)
+
+    journal = Journal(os.path.join(workdir, "journal"), store, compact_every=taps * 2)
+    journal.open()
+
+    def journaled_taps(_):
+        apply = store.apply
+        record = journal.record
+        for slot, delta in seq:
+            applied = apply(slot, delta)
+            if applied:
+                record(slot, applied)
+        journal.flush()
+
+    bench.run("model.taps+journal", journaled_taps, setup=store.reset, ops=taps)
+    journal.close()
+
+    fill(store)
+    bench.run("model.recompute", lambda _: store.recompute(), ops=len(store))
+    path = os.path.join(workdir, "report.csv")
+    bench.run("report.save", lambda _: write_report(path, store, store.snapshot()), ops=len(store))
+    bench.run("report.load", lambda _: store.load(read_report(path, store)[0]), ops=len(store))
+
+
+def ui_benchmarks(bench, catalog, taps, workdir):
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    os.environ.setdefault("KIVY_NO_FILELOG", "1")
+    # Kivy's logger replaces the standard streams on import; keep ours for the results
+    streams = sys.stdout, sys.stderr
+    try:
+        import main
+    except ImportError as e:
+        for name in ("ui.build", "ui.taps", "ui.batch", "ui.update_all", "ui.save_report", "ui.load_report"):
+            bench.skip(name, f"Kivy unavailable ({e})")
+        return
+    finally:
+        sys.stdout, sys.stderr = streams
+
+    class BenchApp(main.MainApp):
+        prebuild_delay = None
+        history_enabled = False
+        reports_dir = workdir
+
+        @property
+        def user_data_dir(self):
+            return os.path.join(workdir, "app")
+
+    BenchApp.catalog = catalog
+
+    apps = []
+
+    def new_app():
+        # Close the previous build's journal and flush timer before its files go
+        if apps:
+            apps.pop().on_stop()
+        shutil.rmtree(os.path.join(workdir, "app"), ignore_errors=True)
+        apps.append(BenchApp())
+        return apps[-1]
+
+    bench.run("ui.build", lambda app: app.build(), setup=new_app)
+
+    app = new_app()
+    app.build()
+    for cat in app.categories:
+        cat.ensure_built()
+        cat.body.size = (480, 800)
+    from kivy.clock import Clock
+    Clock.tick()
+    views = [view for cat in app.categories for view in cat.product_list.layout_manager.children]
+    rng = random.Random(3)
+    presses = [(rng.choice(views), rng.random() < 0.85) for _ in range(taps)]
+
+    def tap(_):
+        for i, (view, up) in enumerate(presses):
+            kind = next(iter(view.slots))
+            view._change(kind, 1 if up else -1)
+            if i % 4 == 3:
+                # Roughly four taps land between two frames
+                app._flush_refresh()
+        app._flush_refresh()
+
+    bench.run("ui.taps", tap, setup=lambda: (app.store.reset(), app.update_all()), ops=taps)
+
+    # The same taps entered as orders of 25 line items, each committed in one batch
+    orders = [[(view.slots[next(iter(view.slots))], 1 if up else -1) for view, up in presses[i:i + 25]]
+              for i in range(0, len(presses), 25)]
+
+    def batch(_):
+        for order in orders:
+            app.apply_batch(order)
+            app._flush_refresh()
+
+    bench.run("ui.batch", batch, setup=lambda: (app.store.reset(), app.update_all()), ops=taps)
+
+    fill(app.store)
+    bench.run("ui.update_all", lambda _: app.update_all(), ops=len(app.store))
+
+    def wait_for_saver():
+        # Only the UI-thread part of save_report is timed; the write itself is report.save
+        while app.saver._running:
+            time.sleep(0.001)
+
+    bench.run("ui.save_report", lambda _: app.save_report(), setup=wait_for_saver, ops=len(app.store))
+    wait_for_saver()
+
+    path = os.path.join(workdir, "ui_report.csv")
+    write_report(path, app.store, app.store.snapshot())
+
+    def load(_):
+        counts, problems = read_report(path, app.store)
+        app._apply_loaded_report(path, counts, problems)
+
+    from kivy.uix.popup import Popup
+    Popup.open = lambda self, *args, **kwargs: None
+    bench.run("ui.load_report", load, ops=len(app.store))
+    app.on_stop()
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as file:
+        baseline = {r["name"]: r for r in json.load(file)["results"] if "best" in r}
+    # Compared per operation, so runs with different --taps or --menu-scale still line up
+    sys.stderr.write(f"\n{'benchmark':<24} {'baseline':>12} {'current':>12} {'ratio':>7}\n")
+    for r in results:
+        old = baseline.get(r["name"])
+        if old is None or "best" not in r:
+            continue
+        before, after = old["best_per_op_us"], r["best_per_op_us"]
+        sys.stderr.write(f"{r['name']:<24} {before:9.3f}us/op {after:9.3f}us/op {after / before:6.2f}x\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the headless benchmark suite.")
+    parser.add_argument("--taps", type=int, default=5000, help="taps per tap benchmark")
+    parser.add_argument("--menu-scale", type=int, default=1, help="multiply every category's products")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per benchmark")
+    parser.add_argument("--model-only", action="store_true", help="skip the Kivy benchmarks")
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    catalog = scaled_catalog(args.menu_scale)
+    bench = Bench(args.repeat)
+    workdir = tempfile.mkdtemp(prefix="cups-bench-")
+    try:
+        model_benchmarks(bench, catalog, args.taps, workdir)
+        if not args.model_only:
+            ui_benchmarks(bench, catalog, args.taps, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "taps": args.taps,
+        "menu_scale": args.menu_scale,
+        "slots": len(CountStore(catalog)),
+        "results": bench.results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    if args.compare:
+        compare(bench.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Menu catalog: tab order, products and prices, read from catalog.json.
+
+    {"version": 2,
+     "categories": [
+       {"name": "Praf", "kind": "size", "medio": 49, "grande": 59, "products": ["PCA", "PISTACIO"],
+        "formerly": ["Frappe"], "renamed": {"PISTACHIO": "PISTACIO"}},
+       {"name": "Hot Brew", "kind": "single", "prices": {"HB": 39, "HF": 39}}]}
+
+Categories appear as tabs in file order. "formerly" and "renamed" list old
+category and product names, so reports saved under an earlier version of the
+catalog still load into the current one.
+
+The file is validated and compiled once; the compiled form is cached and
+reused while the file's mtime and size are unchanged.
+"""
+import json
+import os
+
+from model import CategorySpec
+
+
+CATALOG_NAME = "catalog.json"
+CACHE_NAME = "catalog.cache.json"
+CACHE_VERSION = 1
+BUNDLED_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), CATALOG_NAME)
+KINDS = ("size", "single", "addons")
+
+# Compiled catalogs already loaded by this process, by path
+_loaded = {}
+
+
+class CatalogError(Exception):
+    pass
+
+
+class Catalog:
+    __slots__ = ("version", "categories", "aliases")
+
+    def __init__(self, version, categories, aliases=None):
+        self.version = version
+        self.categories = categories
+        # (old category, old product) -> (category, product)
+        self.aliases = aliases or {}
+
+    def resolve(self, category, product):
+        return self.aliases.get((category, product), (category, product))
+
+
+def _price(value, where):
+    if type(value) is not int or value < 0:
+        raise CatalogError(f"{where}: price must be a whole number of pesos, got {value!r}")
+    return value
+
+
+def compile_catalog(data):
+    # Validates parsed catalog JSON and returns its compiled, JSON-ready form:
+    # one [name, kind, products, medio, grande, prices] entry per category and
+    # one [old category, old product, category, product] entry per alias
+    if not isinstance(data, dict) or not isinstance(data.get("categories"), list):
+        raise CatalogError("expected an object with a list of categories")
+    version = data.get("version")
+    if type(version) is not int:
+        raise CatalogError(f"version must be an integer, got {version!r}")
+
+    categories = []
+    names = set()
+    for i, entry in enumerate(data["categories"]):
+        name = entry.get("name") if isinstance(entry, dict) else None
+        if not isinstance(name, str) or not name:
+            raise CatalogError(f"category {i + 1}: missing name")
+        if name in names:
+            raise CatalogError(f"{name}: duplicate category")
+        names.add(name)
+        kind = entry.get("kind", "size")
+        if kind not in KINDS:
+            raise CatalogError(f"{name}: kind must be one of {', '.join(KINDS)}")
+        if kind == "size":
+            products = entry.get("products")
+            medio = _price(entry.get("medio"), f"{name} medio")
+            grande = _price(entry.get("grande"), f"{name} grande")
+            prices = {}
+        else:
+            prices = entry.get("prices")
+            if not isinstance(prices, dict):
+                raise CatalogError(f"{name}: {kind} categories need a prices object")
+            products = list(prices)
+            prices = {product: _price(price, f"{name} / {product}") for product, price in prices.items()}
+            medio = grande = None
+        if not isinstance(products, list) or not products:
+            raise CatalogError(f"{name}: no products")
+        if not all(isinstance(p, str) and p for p in products) or len(set(products)) != len(products):
+            raise CatalogError(f"{name}: product names must be unique, non-empty strings")
+        categories.append([name, kind, products, medio, grande, prices])
+
+    current = {(c[0], p) for c in categories for p in c[2]}
+    aliases = {}
+    for entry, (name, kind, products, *_) in zip(data["categories"], categories):
+        formerly = entry.get("formerly", [])
+        renamed = entry.get("renamed", {})
+        if (not isinstance(formerly, list) or not all(isinstance(old, str) and old for old in formerly)
+                or not isinstance(renamed, dict) or not all(isinstance(new, str) for new in renamed.values())):
+            raise CatalogError(f"{name}: formerly must be a list of names and renamed an object of product names")
+        for old, new in renamed.items():
+            if new not in products:
+                raise CatalogError(f"{name}: {old} is renamed to unknown product {new}")
+        for old_name in [name] + formerly:
+            for old, new in [(p, p) for p in products] + list(renamed.items()):
+                if (old_name, old) == (name, new):
+                    continue
+                if (old_name, old) in current or (old_name, old) in aliases:
+                    raise CatalogError(f"{old_name} / {old}: old name is already in use")
+                aliases[(old_name, old)] = [old_name, old, name, new]
+    return {"version": version, "categories": categories, "aliases": list(aliases.values())}
+
+
+def from_compiled(compiled):
+    categories = [CategorySpec(name, products, kind=kind, price_medio=medio, price_grande=grande,
+                               fixed_prices=prices)
+                  for name, kind, products, medio, grande, prices in compiled["categories"]]
+    aliases = {(old_cat, old): (cat, new) for old_cat, old, cat, new in compiled["aliases"]}
+    return Catalog(compiled["version"], categories, aliases)
+
+
+def _read_cache(cache_path, source, stamp):
+    try:
+        with open(cache_path) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION or data.get("source") != source or data.get("stamp") != stamp:
+        return None
+    return data.get("catalog")
+
+
+def _write_cache(cache_path, source, stamp, compiled):
+    tmp_path = cache_path + ".tmp"
+    try:
+        with open(tmp_path, "w") as file:
+            json.dump({"version": CACHE_VERSION, "source": source, "stamp": stamp, "catalog": compiled}, file)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def load_catalog(path=None, cache_path=None):
+    # Raises CatalogError for a missing, unreadable or invalid catalog file
+    source = os.path.abspath(path or BUNDLED_CATALOG)
+    try:
+        st = os.stat(source)
+    except OSError as e:
+        raise CatalogError(f"{source}: {e.strerror}")
+    stamp = [st.st_mtime_ns, st.st_size]
+    loaded = _loaded.get(source)
+    if loaded and loaded[0] == stamp:
+        return loaded[1]
+
+    compiled = _read_cache(cache_path, source, stamp) if cache_path else None
+    catalog = None
+    if compiled is not None:
+        try:
+            catalog = from_compiled(compiled)
+        except (KeyError, TypeError, ValueError):
+            # A damaged cache is rebuilt from the catalog file
+            pass
+    if catalog is None:
+        try:
+            with open(source, encoding="utf-8") as file:
+                data = json.load(file)
+        except OSError as e:
+            raise CatalogError(f"{source}: {e.strerror}")
+        except ValueError as e:
+            raise CatalogError(f"{source}: not valid JSON ({e})")
+        compiled = compile_catalog(data)
+        if cache_path:
+            _write_cache(cache_path, source, stamp, compiled)
+        catalog = from_compiled(compiled)
+    _loaded[source] = (stamp, catalog)
+    return catalog
+
+
+def default_catalog():
+    # Categories of the catalog shipped with the app
+    return load_catalog().categories
@@ -0,0 +1,275 @@
+"""Embedded SQLite history of saved reports and of the shifts ended in the app.
+
+    python history.py --db history.sqlite3 import reports/*.csv
+    python history.py --db history.sqlite3 total 2026-03-01 2026-03-31 --product PISTACIO --size grande --weekends
+    python history.py --db history.sqlite3 top 2026-03-01 2026-03-31 --limit 5
+    python history.py --db history.sqlite3 total 2026-03-01 2026-03-31 --cashier Ana
+"""
+import argparse
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+from aggregate import find_reports, parse_report
+from catalog import load_catalog
+from model import SIZES, CountStore
+from reports import report_time
+
+
+HISTORY_NAME = "history.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY,
+    branch TEXT NOT NULL DEFAULT '',
+    source TEXT NOT NULL,
+    saved_at TEXT NOT NULL,
+    day TEXT NOT NULL,
+    weekday INTEGER NOT NULL,
+    UNIQUE (branch, source)
+);
+CREATE TABLE IF NOT EXISTS lines (
+    report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    product TEXT NOT NULL,
+    size TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sale INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shifts (
+    id INTEGER PRIMARY KEY,
+    branch TEXT NOT NULL DEFAULT '',
+    cashier TEXT NOT NULL,
+    started TEXT NOT NULL,
+    ended TEXT NOT NULL,
+    day TEXT NOT NULL,
+    weekday INTEGER NOT NULL,
+    UNIQUE (branch, ended)
+);
+CREATE TABLE IF NOT EXISTS shift_lines (
+    shift_id INTEGER NOT NULL REFERENCES shifts(id) ON DELETE CASCADE,
+    category TEXT NOT NULL,
+    product TEXT NOT NULL,
+    size TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    sale INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_day ON reports(day, branch, saved_at);
+CREATE INDEX IF NOT EXISTS lines_product ON lines(category, product, size);
+CREATE INDEX IF NOT EXISTS lines_report ON lines(report_id);
+CREATE INDEX IF NOT EXISTS shifts_cashier ON shifts(cashier, day);
+CREATE INDEX IF NOT EXISTS shift_lines_shift ON shift_lines(shift_id);
+"""
+
+# Reports hold the running tally, so by default only the last save of each day and branch counts.
+# Per-cashier figures come from the shifts table instead, which holds what each shift added.
+LATEST_PER_DAY = ("r.saved_at = (SELECT MAX(saved_at) FROM reports AS latest "
+                  "WHERE latest.day = r.day AND latest.branch = r.branch)")
+
+
+class HistoryStore:
+    # Connections are opened per call so saves from worker threads and queries
+    # from the UI thread never share one
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _insert(self, conn, branch, source, saved_at, lines):
+        conn.execute("DELETE FROM reports WHERE branch = ? AND source = ?", (branch, source))
+        cur = conn.execute(
+            "INSERT INTO reports (branch, source, saved_at, day, weekday) VALUES (?, ?, ?, ?, ?)",
+            (branch, source, saved_at.isoformat(sep=" "), saved_at.strftime("%Y-%m-%d"), saved_at.weekday()))
+        report_id = cur.lastrowid
+        conn.executemany("INSERT INTO lines (report_id, category, product, size, count, sale) VALUES (?, ?, ?, ?, ?, ?)",
+                         ((report_id,) + tuple(line) for line in lines))
+        return report_id
+
+    def add_counts(self, source, saved_at, store, counts, branch=None):
+        # ``source`` is the saved report's path; see branch_name
+        if branch is None:
+            branch = branch_name(os.path.dirname(source))
+        with self.connect() as conn:
+            return self._insert(conn, branch, os.path.basename(source), saved_at, store_lines(store, counts))
+
+    def add_shift(self, branch, cashier, started, ended, store, counts):
+        # ``counts`` are what the shift added to every slot; times are timestamps
+        started = datetime.fromtimestamp(started)
+        ended = datetime.fromtimestamp(ended)
+        with self.connect() as conn:
+            conn.execute("DELETE FROM shifts WHERE branch = ? AND ended = ?", (branch, ended.isoformat(sep=" ")))
+            cur = conn.execute(
+                "INSERT INTO shifts (branch, cashier, started, ended, day, weekday) VALUES (?, ?, ?, ?, ?, ?)",
+                (branch, cashier, started.isoformat(sep=" "), ended.isoformat(sep=" "), ended.strftime("%Y-%m-%d"),
+                 ended.weekday()))
+            shift_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO shift_lines (shift_id, category, product, size, count, sale) VALUES (?, ?, ?, ?, ?, ?)",
+                ((shift_id,) + line for line in store_lines(store, counts)))
+            return shift_id
+
+    def import_reports(self, paths, store=None, batch_size=50, branch=None):
+        # Bulk-loads saved CSVs, committing once per ``batch_size`` files. The
+        # branch is ``branch`` or else worked out per file by branch_name.
+        # Returns the number of reports imported and the paths of files that
+        # could not be read.
+        if store is None:
+            catalog = load_catalog()
+            store = CountStore(catalog.categories, catalog.aliases)
+        imported = 0
+        skipped = []
+        with self.connect() as conn:
+            for start in range(0, len(paths), batch_size):
+                for path in paths[start:start + batch_size]:
+                    saved_at = report_time(path)
+                    if saved_at is None:
+                        continue
+                    lines = csv_lines(path, store)
+                    if lines is None:
+                        skipped.append(path)
+                        continue
+                    self._insert(conn, branch or branch_name(os.path.dirname(path)), os.path.basename(path), saved_at, lines)
+                    imported += 1
+                conn.commit()
+        return imported, skipped
+
+    def _filters(self, start, end, category, product, size, weekdays, cashier, latest_only):
+        # Returns the tables to read and the WHERE clause with its parameters
+        if cashier is None:
+            tables = "lines AS l JOIN reports AS r ON r.id = l.report_id"
+        else:
+            tables = "shift_lines AS l JOIN shifts AS r ON r.id = l.shift_id"
+        where = ["r.day BETWEEN ? AND ?"]
+        params = [str(start), str(end)]
+        for column, value in (("l.category", category), ("l.product", product), ("l.size", size),
+                              ("r.cashier", cashier)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if weekdays:
+            where.append(f"r.weekday IN ({', '.join('?' * len(weekdays))})")
+            params.extend(weekdays)
+        if latest_only and cashier is None:
+            where.append(LATEST_PER_DAY)
+        return tables, " AND ".join(where), params
+
+    def range_totals(self, start, end, category=None, product=None, size=None, weekdays=None, cashier=None,
+                     latest_only=True):
+        # Days are inclusive "YYYY-MM-DD" strings; weekdays use Monday == 0. With
+        # ``cashier`` the figures are the sum of that cashier's shifts.
+        tables, where, params = self._filters(start, end, category, product, size, weekdays, cashier, latest_only)
+        with self.connect() as conn:
+            row = conn.execute(
+                f"SELECT COALESCE(SUM(l.count), 0), COALESCE(SUM(l.sale), 0) "
+                f"FROM {tables} WHERE {where}", params).fetchone()
+        return row[0], row[1]
+
+    def top_products(self, start, end, limit=10, by="cups", category=None, weekdays=None, cashier=None,
+                     latest_only=True):
+        order = "cups" if by == "cups" else "sales"
+        tables, where, params = self._filters(start, end, category, None, None, weekdays, cashier, latest_only)
+        with self.connect() as conn:
+            return conn.execute(
+                f"SELECT l.category, l.product, SUM(l.count) AS cups, SUM(l.sale) AS sales "
+                f"FROM {tables} WHERE {where} "
+                f"GROUP BY l.category, l.product ORDER BY {order} DESC LIMIT ?", params + [limit]).fetchall()
+
+
+def branch_name(directory):
+    # Reports and shifts are told apart per branch by the name of the directory
+    # the reports are saved in, both when the app records them and when they
+    # are imported
+    return os.path.basename(os.path.abspath(directory))
+
+
+def store_lines(store, counts):
+    return [(store.categories[store.slot_category[slot]].name, store.slot_product[slot],
+             SIZES[store.slot_size[slot]], counts[slot], counts[slot] * store.prices[slot])
+            for slot in range(len(counts)) if counts[slot]]
+
+
+def csv_lines(path, store):
+    # Splits each CSV row into per-size lines under the current catalog names. The
+    # row's saved Sale is what was charged back then, so it is kept as is and split
+    # over the sizes in proportion to their share at today's prices (by count for
+    # products no longer in the catalog). None when the file cannot be read.
+    parsed = parse_report(path)
+    if parsed is None:
+        return None
+    lines = []
+    for category, product, medio, grande, fixed, sale in parsed:
+        category, product = store.aliases.get((category, product), (category, product))
+        slots = store.product_index.get((category, product), {})
+        counted = [(size, count) for size, count in zip(SIZES, (medio, grande, fixed)) if count]
+        weights = [count * (store.prices[slots[size]] if size in slots else 1) for size, count in counted]
+        total = sum(weights)
+        left = sale
+        for i, ((size, count), weight) in enumerate(zip(counted, weights)):
+            line_sale = left if i == len(counted) - 1 else (sale * weight // total if total else 0)
+            left -= line_sale
+            lines.append((category, product, size, count, line_sale))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query and fill the saved-report history database.")
+    parser.add_argument("--db", default=HISTORY_NAME)
+    parser.add_argument("--catalog", help="catalog file (default: the bundled catalog.json)")
+    commands = parser.add_subparsers(dest="command")
+    importer = commands.add_parser("import", help="bulk-load saved report CSVs")
+    importer.add_argument("paths", nargs="+")
+    importer.add_argument("--batch-size", type=int, default=50)
+    importer.add_argument("--branch", help="branch to file the reports under (default: their directory's name)")
+    for name in ("total", "top"):
+        cmd = commands.add_parser(name)
+        cmd.add_argument("start", help="first day, YYYY-MM-DD")
+        cmd.add_argument("end", help="last day, YYYY-MM-DD")
+        cmd.add_argument("--category")
+        cmd.add_argument("--cashier", help="only the shifts this cashier ended with End Shift")
+        cmd.add_argument("--weekends", action="store_true")
+        cmd.add_argument("--all-saves", action="store_true")
+    commands.choices["total"].add_argument("--product")
+    commands.choices["total"].add_argument("--size", choices=SIZES)
+    commands.choices["top"].add_argument("--limit", type=int, default=10)
+    commands.choices["top"].add_argument("--by", choices=("cups", "sales"), default="cups")
+    args = parser.parse_args(argv)
+
+    history = HistoryStore(args.db)
+    if args.command == "import":
+        started = datetime.now()
+        catalog = load_catalog(args.catalog)
+        store = CountStore(catalog.categories, catalog.aliases)
+        count, skipped = history.import_reports(find_reports(args.paths), store, batch_size=args.batch_size,
+                                                 branch=args.branch)
+        for path in skipped:
+            sys.stderr.write(f"skipped {path}: not a readable report\n")
+        print(f"Imported {count} report(s) in {(datetime.now() - started).total_seconds():.2f}s")
+    elif args.command in ("total", "top"):
+        weekdays = (5, 6) if args.weekends else None
+        if args.command == "total":
+            cups, sales = history.range_totals(args.start, args.end, args.category, args.product, args.size,
+                                               weekdays, args.cashier, not args.all_saves)
+            print(f"cups {cups}  sales ₱{sales}")
+        else:
+            for category, product, cups, sales in history.top_products(
+                    args.start, args.end, args.limit, args.by, args.category, weekdays, args.cashier,
+                    not args.all_saves):
+                print(f"{category:<16} {product:<10} cups {cups:>6}  sales ₱{sales}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import json
+import os
+import struct
+import time
+import zlib
+from array import array
+
+
+SNAPSHOT_NAME = "counts.snap"
+JOURNAL_NAME = "counts.journal"
+
+# Both files start with: magic, catalog signature, generation. The journal is
+# only replayed on top of the snapshot of the same generation, so a crash in
+# the middle of a compaction never applies the same taps twice. The snapshot
+# then holds the business day its tally belongs to (YYYYMMDD) and lists the
+# (category, product, size) key of every slot, followed by the counts; journal
+# records use the snapshot's slot numbers.
+HEADER = struct.Struct("<4sII")
+DAY = struct.Struct("<I")
+SNAPSHOT_MAGIC = b"CUPS"
+JOURNAL_MAGIC = b"CUPJ"
+RECORD = struct.Struct("<Hi")
+# Byte length of the JSON list of slot keys that follows
+KEYS = struct.Struct("<I")
+
+
+def day_of(when=None):
+    # Local calendar day of a timestamp (default now) as YYYYMMDD
+    t = time.localtime(when)
+    return t.tm_year * 10000 + t.tm_mon * 100 + t.tm_mday
+
+
+def slot_keys(store):
+    return [key for key, _ in sorted(store.index.items(), key=lambda item: item[1])]
+
+
+def catalog_signature(store):
+    return zlib.crc32("\n".join("|".join(key) for key in slot_keys(store)).encode("utf-8"))
+
+
+def pack_keys(store):
+    data = json.dumps(slot_keys(store), separators=(",", ":")).encode("utf-8")
+    return KEYS.pack(len(data)) + data
+
+
+def unpack_keys(data, offset):
+    # Returns the slot keys stored at ``offset`` and the offset after them; the
+    # keys are None when the block is damaged
+    if offset + KEYS.size > len(data):
+        return None, offset
+    (size,) = KEYS.unpack_from(data, offset)
+    start = offset + KEYS.size
+    try:
+        keys = json.loads(data[start:start + size].decode("utf-8"))
+    except ValueError:
+        return None, offset
+    if not isinstance(keys, list) or not all(isinstance(key, list) and len(key) == 3 for key in keys):
+        return None, offset
+    return [tuple(key) for key in keys], start + size
+
+
+def slot_map(store, keys):
+    # Slot of ``store`` for every slot listed in ``keys`` (as written under an
+    # earlier catalog), following renames; None where the product is gone
+    mapping = []
+    for category, product, size in keys:
+        slots = store.lookup(category, product)
+        mapping.append(slots.get(size) if slots else None)
+    return mapping
+
+
+def remap(counts, mapping, size):
+    # Counts laid out like ``mapping``'s keys, moved to their slots in a layout of ``size`` slots
+    moved = array(counts.typecode, bytes(size * counts.itemsize))
+    for old, count in enumerate(counts):
+        if count and mapping[old] is not None:
+            moved[mapping[old]] += count
+    return moved
+
+
+def move_aside(path):
+    # Keeps a file that can no longer be used under a new name instead of
+    # letting it be overwritten, so its data can still be recovered by hand
+    aside = f"{path}.{time.strftime('%Y%m%d_%H%M%S')}"
+    try:
+        os.replace(path, aside)
+    except OSError:
+        return None
+    return aside
+
+
+class Journal:
+    # Append-only log of applied count deltas on top of the last counts snapshot.
+    # Records are buffered in memory and written every ``flush_every`` taps (or
+    # whenever ``flush`` is called); after ``compact_every`` records the journal
+    # is folded into a fresh snapshot so replay stays short.
+    def __init__(self, directory, store, flush_every=32, compact_every=4096):
+        self.directory = directory
+        self.store = store
+        self.flush_every = flush_every
+        self.compact_every = compact_every
+        self.signature = catalog_signature(store)
+        self.keys = pack_keys(store)
+        self.generation = 0
+        # Day the restored tally belongs to; 0 until one is started
+        self.day = 0
+        self.records = 0
+        self._buffer = bytearray()
+        self._pending = 0
+        self._file = None
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, SNAPSHOT_NAME)
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, JOURNAL_NAME)
+
+    def open(self):
+        # Restores the store from disk and returns the number of replayed records
+        os.makedirs(self.directory, exist_ok=True)
+        snapshot = self._read_snapshot()
+        replayed = self._replay(snapshot)
+        if snapshot is None or snapshot[1] is not None:
+            # First start, or the catalog changed since the files were written:
+            # keep the old files and continue in the current layout
+            if snapshot is not None:
+                move_aside(self.snapshot_path)
+                move_aside(self.journal_path)
+            self._file = open(self.journal_path, "ab")
+            self.compact()
+            return replayed
+        self._file = open(self.journal_path, "ab")
+        if replayed == 0:
+            self._reset_journal()
+        self.records = replayed
+        if self.records >= self.compact_every:
+            self.compact()
+        return replayed
+
+    def _read_snapshot(self):
+        # Loads the snapshot into the store. Returns None without a usable one,
+        # otherwise (signature, mapping), where ``mapping`` turns the snapshot's
+        # slots into the store's and is None when the catalog is unchanged.
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return None
+        keys = None
+        if len(data) >= HEADER.size:
+            magic, signature, generation = HEADER.unpack_from(data)
+            if magic == SNAPSHOT_MAGIC and len(data) >= HEADER.size + DAY.size:
+                (day,) = DAY.unpack_from(data, HEADER.size)
+                keys, offset = unpack_keys(data, HEADER.size + DAY.size)
+        counts = array("l")
+        if keys is None or len(data) - offset != len(keys) * counts.itemsize:
+            move_aside(self.snapshot_path)
+            return None
+        counts.frombytes(data[offset:])
+        mapping = None
+        if signature != self.signature:
+            mapping = slot_map(self.store, keys)
+            counts = remap(counts, mapping, len(self.store))
+        self.store.load(counts)
+        self.generation = generation
+        self.day = day
+        return signature, mapping
+
+    def _replay(self, snapshot):
+        try:
+            with open(self.journal_path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return 0
+        header = HEADER.unpack_from(data) if len(data) >= HEADER.size else None
+        if snapshot is None or header != (JOURNAL_MAGIC, snapshot[0], self.generation):
+            # A leftover of an interrupted compaction only holds taps already in the
+            # snapshot; anything else has nothing to be applied to, so it is kept
+            leftover = snapshot is not None and header == (JOURNAL_MAGIC, snapshot[0], self.generation - 1)
+            if not leftover and len(data) > HEADER.size:
+                move_aside(self.journal_path)
+            return 0
+        mapping = snapshot[1]
+        end = HEADER.size + (len(data) - HEADER.size) // RECORD.size * RECORD.size
+        size = len(self.store)
+        replayed = 0
+        for slot, delta in RECORD.iter_unpack(data[HEADER.size:end]):
+            if mapping is not None:
+                slot = mapping[slot] if slot < len(mapping) else None
+            if slot is not None and slot < size:
+                self.store.apply(slot, delta)
+                replayed += 1
+        if end != len(data):
+            # Drop a record torn by a crash so new appends stay aligned
+            with open(self.journal_path, "r+b") as file:
+                file.truncate(end)
+        return replayed
+
+    def record(self, slot, delta):
+        self._buffer += RECORD.pack(slot, delta)
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def record_many(self, records):
+        # A batch of (slot, delta) records goes to disk in one write
+        for slot, delta in records:
+            self._buffer += RECORD.pack(slot, delta)
+        self._pending += len(records)
+        self.flush()
+
+    def flush(self):
+        if not self._pending or self._file is None:
+            return
+        self._file.write(self._buffer)
+        self._file.flush()
+        self.records += self._pending
+        del self._buffer[:]
+        self._pending = 0
+        if self.records >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        # Folds everything into a new snapshot; also used after the counts are replaced wholesale
+        del self._buffer[:]
+        self._pending = 0
+        self.generation += 1
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(HEADER.pack(SNAPSHOT_MAGIC, self.signature, self.generation))
+            file.write(DAY.pack(self.day))
+            file.write(self.keys)
+            file.write(self.store.counts.tobytes())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self._reset_journal()
+
+    def start_day(self, day):
+        # For after the store was reset at the start of a new business day
+        self.day = day
+        self.compact()
+
+    def _reset_journal(self):
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(HEADER.pack(JOURNAL_MAGIC, self.signature, self.generation))
+        self._file.flush()
+        self.records = 0
+
+    def sync(self):
+        self.flush()
+        if self._file is not None:
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
@@ -1,17 +1,38 @@
+import time
+
+STARTED = time.perf_counter()
+
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.logger import Logger
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.tabbedpanel import TabbedPanel, TabbedPanelItem
-from kivy.uix.scrollview import ScrollView
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 from kivy.metrics import dp
-from kivy.core.clipboard import Clipboard
-from kivy.uix.popup import Popup
-from kivy.uix.textinput import TextInput
-from kivy.uix.filechooser import FileChooserListView
-import csv
-from datetime import datetime
+from kivy.graphics import Color, Line
+import os
+import threading
+
+import perf
+from catalog import CACHE_NAME, CATALOG_NAME, Catalog, CatalogError, load_catalog
+from journal import Journal, day_of
+from model import BUCKETS_PER_CATEGORY, SIZES, CountStore
+from reports import ReportError, ReportIndex, ReportSaver, read_report
+from shifts import SHIFTS_NAME, ShiftLog, performance_text
+from timeseries import SERIES_NAME, TimeSeries, bar_lines, bucket_labels, hourly_path, peaks, write_hourly
+
+# Popups, text inputs, the clipboard and the SQLite history are only imported when first used, as
+# are csv, glob and datetime in reports.py and timeseries.py (Kivy itself already loads json and re)
+perf.startup.reset(STARTED)
+perf.startup.mark("imports")
+
+
+QUANTITY_HINT = "Quantity (negative to take off)"
 
 
 def make_label(text, height=None):
@@ -23,49 +44,64 @@ def make_label(text, height=None):
     return lbl
 
 
-class ProductRow(GridLayout):
-    def __init__(self, product, price_medio=None, price_grande=None, price_fixed=None, update_callback=None, **kwargs):
-        cols = 1
-        if price_medio:
-            cols += 1
-        if price_grande:
-            cols += 1
-        if price_fixed:
-            cols += 2
-        super().__init__(cols=cols, size_hint_y=None, height=dp(40), spacing=0, **kwargs)
-        self.product = product
-        self.price_medio = price_medio
-        self.price_grande = price_grande
-        self.price_fixed = price_fixed
-        self.update_callback = update_callback
+def show_message(title, text, size_hint=(0.6, 0.4)):
+    from kivy.uix.popup import Popup
+    Popup(title=title, content=Label(text=text), size_hint=size_hint).open()
+
+
+class ProductRow(RecycleDataViewBehavior, GridLayout):
+    # Row views are recycled by ProductList: refresh_view_attrs binds a view to another product's slots
+    def __init__(self, **kwargs):
+        super().__init__(cols=1, size_hint_y=None, height=dp(40), spacing=0, **kwargs)
+        self.store = None
+        self.product = None
+        self.slots = {}
+        self.update_callback = None
+        self.quantity_callback = None
+        self.count_labels = {}
 
         # Product name
-        self.add_widget(make_label(product))
+        self.name_label = make_label("")
+        self.add_widget(self.name_label)
+
+        with self.canvas.before:
+            Color(1, 1, 1, 1)
+            self.rect = Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
+        self.bind(pos=self._update_rect, size=self._update_rect)
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.store = rv.store
+        self.update_callback = rv.row_callback
+        self.quantity_callback = rv.quantity_callback
+        self.product = data["product"]
+        self.slots = data["slots"]
+        if not self.count_labels:
+            self._build_counters()
+        self.name_label.text = self.product
+        self.refresh()
+
+    def _build_counters(self):
+        # Every row of a list has the same sizes, so counters are built once per view
+        slots = self.slots
 
         # Medio
-        if price_medio:
-            self.medio_count = 0
-            self.medio_label = make_label("0")
-            self.add_widget(self._make_counter(self.medio_label, "medio"))
+        if "medio" in slots:
+            self.cols += 1
+            self.count_labels["medio"] = make_label("0")
+            self.add_widget(self._make_counter(self.count_labels["medio"], "medio"))
 
         # Grande
-        if price_grande:
-            self.grande_count = 0
-            self.grande_label = make_label("0")
-            self.add_widget(self._make_counter(self.grande_label, "grande"))
+        if "grande" in slots:
+            self.cols += 1
+            self.count_labels["grande"] = make_label("0")
+            self.add_widget(self._make_counter(self.count_labels["grande"], "grande"))
 
         # Fixed-price product (Special Drinks & Secret Menu)
-        if price_fixed:
-            self.fixed_count = 0
-            self.fixed_label = make_label("0")
+        if "fixed" in slots:
+            self.cols += 2
+            self.count_labels["fixed"] = make_label("0")
             self.sale_label = make_label("0")
-            self.add_widget(self._make_counter_with_sale(self.fixed_label, self.sale_label, "fixed"))
-
-        with self.canvas.before:
-            from kivy.graphics import Color, Line
-            Color(1, 1, 1, 1)
-            self.rect = Line(rectangle=(self.x, self.y, self.width, self.height), width=1)
-        self.bind(pos=self._update_rect, size=self._update_rect)
+            self.add_widget(self._make_counter_with_sale(self.count_labels["fixed"], self.sale_label, "fixed"))
 
     def _update_rect(self, *args):
         self.rect.rectangle = (self.x, self.y, self.width, self.height)
@@ -74,221 +110,251 @@ class ProductRow(GridLayout):
         box = BoxLayout(orientation="horizontal", spacing=2)
         btn_minus = Button(text="-", size_hint_x=None, width=dp(36))
         btn_plus = Button(text="+", size_hint_x=None, width=dp(36))
-        btn_minus.bind(on_press=lambda x: self._decrement(label, kind))
-        btn_plus.bind(on_press=lambda x: self._increment(label, kind))
+        btn_minus.bind(on_press=lambda x: self._change(kind, -1))
+        btn_plus.bind(on_press=lambda x: self._change(kind, 1))
+        label.bind(on_touch_down=lambda inst, touch: self._on_count_touch(inst, touch, kind))
         box.add_widget(btn_minus)
         box.add_widget(label)
         box.add_widget(btn_plus)
         return box
 
     def _make_counter_with_sale(self, label, sale_label, kind):
-        box = BoxLayout(orientation="horizontal", spacing=2)
-        btn_minus = Button(text="-", size_hint_x=None, width=dp(36))
-        btn_plus = Button(text="+", size_hint_x=None, width=dp(36))
-        btn_minus.bind(on_press=lambda x: self._decrement_with_sale(label, sale_label, kind))
-        btn_plus.bind(on_press=lambda x: self._increment_with_sale(label, sale_label, kind))
-        box.add_widget(btn_minus)
-        box.add_widget(label)
-        box.add_widget(btn_plus)
+        box = self._make_counter(label, kind)
         box.add_widget(sale_label)
         return box
 
-    def _increment(self, label, kind):
-        if kind == "medio":
-            self.medio_count += 1
-            label.text = str(self.medio_count)
-        elif kind == "grande":
-            self.grande_count += 1
-            label.text = str(self.grande_count)
-        if self.update_callback:
-            self.update_callback()
-
-    def _decrement(self, label, kind):
-        if kind == "medio" and self.medio_count > 0:
-            self.medio_count -= 1
-            label.text = str(self.medio_count)
-        elif kind == "grande" and self.grande_count > 0:
-            self.grande_count -= 1
-            label.text = str(self.grande_count)
-        if self.update_callback:
-            self.update_callback()
+    def _change(self, kind, delta):
+        # The store changes right away; labels are redrawn by the app's next refresh
+        slot = self.slots[kind]
+        applied = self.store.apply(slot, delta)
+        if applied and self.update_callback:
+            self.update_callback(self, slot, applied)
 
-    def _increment_with_sale(self, label, sale_label, kind):
-        if kind == "fixed":
-            self.fixed_count += 1
-            label.text = str(self.fixed_count)
-            sale_label.text = str(self.fixed_count * self.price_fixed)
-        if self.update_callback:
-            self.update_callback()
+    def _on_count_touch(self, label, touch, kind):
+        # Tapping a count opens quantity entry for a large order
+        if not label.collide_point(*touch.pos) or not self.quantity_callback:
+            return False
+        self.quantity_callback(self.slots[kind])
+        return True
+
+    def refresh(self, kind=None):
+        for k in (kind,) if kind else self.slots:
+            slot = self.slots[k]
+            self.count_labels[k].text = str(self.store.counts[slot])
+            if k == "fixed":
+                self.sale_label.text = str(self.store.sale(slot))
+
+
+class ProductList(RecycleView):
+    def __init__(self, store, row_callback, products, quantity_callback=None, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+        self.row_callback = row_callback
+        self.quantity_callback = quantity_callback
+        layout = RecycleBoxLayout(orientation="vertical", spacing=2, padding=2, size_hint_y=None,
+                                  default_size=(None, dp(40)), default_size_hint=(1, None))
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
+        self.viewclass = ProductRow
+        self.data = [{"product": p, "slots": slots} for p, slots in products]
+
+
+class ReportListItem(RecycleDataViewBehavior, Button):
+    def refresh_view_attrs(self, rv, index, data):
+        self.report_list = rv
+        self.filename = data["filename"]
+        self.text = data["text"]
+
+    def on_press(self):
+        self.report_list.on_pick(self.filename)
 
-    def _decrement_with_sale(self, label, sale_label, kind):
-        if kind == "fixed" and self.fixed_count > 0:
-            self.fixed_count -= 1
-            label.text = str(self.fixed_count)
-            sale_label.text = str(self.fixed_count * self.price_fixed)
-        if self.update_callback:
-            self.update_callback()
-
-    def get_totals(self):
-        cups = 0
-        sales = 0
-        if hasattr(self, "medio_count"):
-            cups += self.medio_count
-            sales += self.medio_count * (self.price_medio or 0)
-        if hasattr(self, "grande_count"):
-            cups += self.grande_count
-            sales += self.grande_count * (self.price_grande or 0)
-        if hasattr(self, "fixed_count"):
-            cups += self.fixed_count
-            sales += self.fixed_count * (self.price_fixed or 0)
-        return cups, sales
+
+class ReportList(RecycleView):
+    def __init__(self, on_pick, **kwargs):
+        super().__init__(**kwargs)
+        self.on_pick = on_pick
+        layout = RecycleBoxLayout(orientation="vertical", spacing=2, size_hint_y=None,
+                                  default_size=(None, dp(40)), default_size_hint=(1, None))
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
+        self.viewclass = ReportListItem
 
 
 class Category(TabbedPanelItem):
-    def __init__(self, name, products, kind="size", price_medio=None, price_grande=None, fixed_prices=None,
-                 update_callback=None, **kwargs):
+    TOTALS_FORMATS = {
+        "size": ("Total Medio: {} cups | ₱{}", "Total Grande: {} cups | ₱{}"),
+        "single": ("Total: {} cups | ₱{}",),
+        "addons": ("Total AO: {} | ₱{}", "Total ES: {} | ₱{}"),
+    }
+
+    def __init__(self, store, index, update_callback=None, quantity_callback=None, **kwargs):
         super().__init__(**kwargs)
-        self.text = name
-        self.kind = kind
-        self.price_medio = price_medio
-        self.price_grande = price_grande
-        self.fixed_prices = fixed_prices or {}
+        spec = store.categories[index]
+        self.store = store
+        self.index = index
+        self.text = spec.name
+        self.kind = spec.kind
         self.update_callback = update_callback
+        self.quantity_callback = quantity_callback
+        self.product_list = None
+        self.totals_labels = []
+        self.built = False
+
+        # Row widgets are only created when the tab is first shown (see ensure_built)
+        self.body = BoxLayout(orientation="vertical", spacing=2, padding=2)
+        self.add_widget(self.body)
+
+    def on_state(self, instance, value):
+        if value == "down":
+            self.ensure_built()
 
-        scroll = ScrollView()
-        self.container = BoxLayout(orientation="vertical", spacing=2, padding=2, size_hint_y=None)
-        self.container.bind(minimum_height=self.container.setter("height"))
+    def ensure_built(self):
+        if self.built:
+            return
+        self.built = True
+        started = time.perf_counter()
+        spec = self.store.categories[self.index]
 
         headers = ["PRODUCT"]
-        if kind == "size":
+        if self.kind == "size":
             headers += ["MEDIO", "GRANDE"]
-        elif kind == "single":
+        elif self.kind == "single":
             headers += ["COUNT", "SALE"]
-        elif kind == "addons":
+        elif self.kind == "addons":
             headers += ["COUNT"]
 
         header_grid = GridLayout(cols=len(headers), size_hint_y=None, height=dp(32))
         for h in headers:
             header_grid.add_widget(make_label(h, height=dp(32)))
-        self.container.add_widget(header_grid)
+        self.body.add_widget(header_grid)
 
-        self.rows = []
-        for p in products:
-            if kind == "single" or kind == "addons":
-                price = self.fixed_prices.get(p, None)
-                row = ProductRow(p, price_fixed=price, update_callback=self.update_callback)
-            else:
-                row = ProductRow(p, price_medio=self.price_medio, price_grande=self.price_grande,
-                                 update_callback=self.update_callback)
-            self.rows.append(row)
-            self.container.add_widget(row)
-
-        if kind == "addons":
-            self.ao_label = make_label("Total AO: 0 | ₱0", height=dp(28))
-            self.es_label = make_label("Total ES: 0 | ₱0", height=dp(28))
+        products = [(p, self.store.product_slots(self.index, p)) for p in spec.products]
+        self.product_list = ProductList(self.store, self._on_row_changed, products, self.quantity_callback)
+        self.body.add_widget(self.product_list)
+
+        # One label per totals bucket of this category, in bucket order
+        self.totals_labels = [make_label(fmt.format(0, 0), height=dp(28)) for fmt in self.TOTALS_FORMATS[self.kind]]
+        if self.kind == "addons":
             totals_box = BoxLayout(orientation="horizontal", size_hint_y=None, height=dp(32), spacing=8)
-            totals_box.add_widget(self.ao_label)
-            totals_box.add_widget(self.es_label)
-            self.container.add_widget(totals_box)
-        elif kind == "size":
-            self.medio_label = make_label("Total Medio: 0 cups | ₱0", height=dp(28))
-            self.grande_label = make_label("Total Grande: 0 cups | ₱0", height=dp(28))
+        elif self.kind == "size":
             totals_box = BoxLayout(orientation="vertical", size_hint_y=None, height=dp(64), spacing=4)
-            totals_box.add_widget(self.medio_label)
-            totals_box.add_widget(self.grande_label)
-            self.container.add_widget(totals_box)
         else:
-            self.single_label = make_label("Total: 0 cups | ₱0", height=dp(28))
-            self.container.add_widget(self.single_label)
+            totals_box = None
+        if totals_box:
+            for lbl in self.totals_labels:
+                totals_box.add_widget(lbl)
+            self.body.add_widget(totals_box)
+        else:
+            self.body.add_widget(self.totals_labels[0])
+
+        self.update_totals()
+        perf.startup.tab_built(spec.name, time.perf_counter() - started)
 
-        scroll.add_widget(self.container)
-        self.add_widget(scroll)
-        self.last_totals = {"cups": 0, "sales": 0, "ao_cups": 0, "ao_sales": 0, "es_cups": 0, "es_sales": 0}
+    def refresh_bucket(self, bucket):
+        b = bucket - self.index * BUCKETS_PER_CATEGORY
+        cups, sales = self.store.bucket_totals(bucket)
+        self.totals_labels[b].text = self.TOTALS_FORMATS[self.kind][b].format(cups, sales)
+
+    def _on_row_changed(self, row, slot, delta):
+        if self.update_callback:
+            self.update_callback(self, row, slot, delta)
 
     def update_totals(self):
-        cups = 0
-        sales = 0
-        if self.kind == "size":
-            medio_cups = sum(getattr(r, "medio_count", 0) for r in self.rows)
-            grande_cups = sum(getattr(r, "grande_count", 0) for r in self.rows)
-            medio_sales = sum(getattr(r, "medio_count", 0) * (r.price_medio or 0) for r in self.rows)
-            grande_sales = sum(getattr(r, "grande_count", 0) * (r.price_grande or 0) for r in self.rows)
-            self.medio_label.text = f"Total Medio: {medio_cups} cups | ₱{medio_sales}"
-            self.grande_label.text = f"Total Grande: {grande_cups} cups | ₱{grande_sales}"
-            cups = medio_cups + grande_cups
-            sales = medio_sales + grande_sales
-        elif self.kind == "single":
-            total_cups = sum(getattr(r, "fixed_count", 0) for r in self.rows)
-            total_sales = sum(getattr(r, "fixed_count", 0) * (r.price_fixed or 0) for r in self.rows)
-            self.single_label.text = f"Total: {total_cups} cups | ₱{total_sales}"
-            cups = total_cups
-            sales = total_sales
-        elif self.kind == "addons":
-            ao_cups = sum(getattr(r, "fixed_count", 0) for r in self.rows if r.product != "ES")
-            ao_sales = sum(getattr(r, "fixed_count", 0) * r.price_fixed for r in self.rows if r.product != "ES")
-            es_cups = sum(getattr(r, "fixed_count", 0) for r in self.rows if r.product == "ES")
-            es_sales = sum(getattr(r, "fixed_count", 0) * r.price_fixed for r in self.rows if r.product == "ES")
-            self.ao_label.text = f"Total AO: {ao_cups} | ₱{ao_sales}"
-            self.es_label.text = f"Total ES: {es_cups} | ₱{es_sales}"
-            cups = ao_cups + es_cups
-            sales = ao_sales + es_sales
-        self.last_totals = {"cups": cups, "sales": sales}
-        return self.last_totals
+        if self.product_list:
+            self.product_list.refresh_from_data()
+        first = self.index * BUCKETS_PER_CATEGORY
+        for b in range(len(self.totals_labels)):
+            self.refresh_bucket(first + b)
+        return self.store.category_totals(self.index)
 
 
 class MainApp(App):
+    # List of model.CategorySpec to use instead of catalog.json
+    catalog = None
+    # Seconds after start before the remaining tabs are built in the background; None disables it
+    prebuild_delay = 0.5
+    # Also record every saved report in the SQLite history (history.py)
+    history_enabled = True
+    # Collect latency histograms (perf.py); also toggled by tapping the title five times
+    perf_enabled = False
+    # Seconds between journal flushes when fewer taps than Journal.flush_every are buffered
+    journal_flush_interval = 2
+    # Seconds from process start to the first frame before a slow-startup warning is logged
+    startup_budget = 2.0
+    # Share live counts with the other terminals on the LAN (sync.py); also CUPS_SYNC=1
+    sync_enabled = False
+    # "host:port,..." to sync with instead of broadcasting; also CUPS_SYNC_PEERS
+    sync_peers = None
+    sync_port = 47810
+    # Seconds between sending changed counts, and between full resends
+    sync_interval = 0.25
+    sync_full_interval = 5
+    # Seconds per bucket of the tap time series (timeseries.py); must divide a day evenly
+    series_interval = 3600
+    # Where reports, their hourly exports and the report index are saved
+    reports_dir = "."
+    # Largest quantity one entry may add or take off; also keeps counts within the
+    # journal's and sync's 32-bit records
+    max_quantity = 999
+
     def build(self):
         root = BoxLayout(orientation="vertical", padding=6, spacing=6)
 
         # Header
         header = BoxLayout(size_hint_y=None, height=dp(50), padding=6)
-        header.add_widget(Label(text="CUPS REPORT", color=(1, 1, 1, 1), font_size='20sp', halign="center"))
+        title = Label(text="CUPS REPORT", color=(1, 1, 1, 1), font_size='20sp', halign="center")
+        title.bind(on_touch_down=self._on_title_touch)
+        header.add_widget(title)
         menu_btn = Button(text="☰", size_hint_x=None, width=dp(50))
         header.add_widget(menu_btn)
         root.add_widget(header)
+        self.header = header
+        # Only in the header while an order is queued
+        self.order_btn = Button(size_hint_x=None, width=dp(110))
+        self.order_btn.bind(on_press=lambda x: self.show_order())
+        self.order = []
+        self.quantity_popup = None
 
         # Tab panel
         self.panel = TabbedPanel(do_default_tab=False, tab_height=dp(36))
         self.categories = []
 
-        # --- data ---
-        praf_products = ["PCA", "PCJ", "PV", "PSL", "PC", "PCC", "PCNC", "PCM", "PJC",
-                         "PMO", "PMAT", "PS", "PT", "M. MELON", "M. MANGO", "SCB", "UBE", "PANDAN", "PISTACIO"]
-        milk_tea = ["CKMT", "CMT", "CCMT", "CNCMT", "DCMT", "MATMT", "OMT", "RVMT", "SCMT", "SMT", "TMT", "WMT"]
-        iced_coffee = ["BIC", "FIC", "KIC", "MACIC", "MOIC", "MATIC", "SIC", "VIC"]
-        fruit_tea = ["BFT", "GAFT", "HPFT", "KFT", "LEFT", "LYFT", "MFT", "SFT"]
-        brosty_products = ["BB", "BGA", "BHP", "BK", "BLE", "BLY", "BM", "BS"]
-        hotbrew_products = ["HB", "HF", "HK", "HMAC", "HMO", "HMAT", "HSL", "HV"]
-
-        hotbrew_prices = {p: 39 for p in hotbrew_products}
-        special_prices = {"SDBP": 66, "SDBB": 66, "SDCD": 48, "KMJS": 60, "SDKV": 72,
-                          "SDSM": 52, "SDSC": 49, "SDCB": 39}
-        secret_prices = {"BARBIE": 82, "BTS": 78, "LOCO": 82, "CRAZY": 82, "TANGO": 77, "BROWNIE": 86}
-        addons_prices = {"P": 9, "CJ": 9, "CC": 9, "CP": 9, "CCH": 9, "CO": 9, "C": 9, "ES": 5}
-
-        tabs = [
-            ("Add Ons", addons_prices, "addons"),
-            ("Brosty", brosty_products, "size", 49, 59),
-            ("Fruit Tea", fruit_tea, "size", 29, 39),
-            ("Hot Brew", hotbrew_products, "single", None, None, hotbrew_prices),
-            ("Iced Coffee", iced_coffee, "size", 29, 39),
-            ("Milk Tea", milk_tea, "size", 29, 39),
-            ("Praf", praf_products, "size", 49, 59),
-            ("Secret Menu", list(secret_prices.keys()), "single", None, None, secret_prices),
-            ("Special Drinks", list(special_prices.keys()), "single", None, None, special_prices)
-        ]
+        perf.startup.mark("app init")
+        catalog = Catalog(0, self.catalog) if self.catalog else self.load_catalog()
+        self.store = CountStore(catalog.categories, catalog.aliases)
+        self._dirty_rows = set()
+        self._dirty_buckets = set()
+        self._dirty_totals = set()
+        self._dirty_categories = set()
+        self._refresh_trigger = Clock.create_trigger(self._flush_refresh)
+        self._oldest_tap = None
+        self._title_taps = []
+        self.set_perf_enabled(self.perf_enabled or os.environ.get("CUPS_PERF") == "1")
+        self.saver = ReportSaver(self.store, self._on_report_saved, after_write=self._after_report_written)
+        self.history = None
 
-        for t in tabs:
-            if t[2] == "addons":
-                cat = Category(t[0], list(t[1].keys()), kind="addons", fixed_prices=t[1],
-                               update_callback=self.update_all)
-            elif t[2] == "size":
-                cat = Category(t[0], t[1], kind="size", price_medio=t[3], price_grande=t[4],
-                               update_callback=self.update_all)
-            else:
-                cat = Category(t[0], t[1], kind="single", fixed_prices=t[5], update_callback=self.update_all)
+        # Restore the running tally from the last snapshot plus the tap journal
+        self.journal = Journal(self.user_data_dir, self.store)
+        self.journal.open()
+        # An earlier day is started over by _check_day on the first frame
+        self._day_declined = None
+        Clock.schedule_interval(self._flush_journal, self.journal_flush_interval)
+        self.shift_log = ShiftLog(os.path.join(self.user_data_dir, SHIFTS_NAME), self.store)
+        self.shift_log.open()
+        self.series = TimeSeries(self.store, self.series_interval)
+        self._series_path = os.path.join(self.user_data_dir, SERIES_NAME)
+        if not self.series.load(self._series_path) or self.series.day != self.journal.day:
+            # Taps bucketed for another day than the tally's belong to no report
+            self.series.clear()
+        self.sync = None
+        if self.sync_enabled or os.environ.get("CUPS_SYNC") == "1":
+            self.start_sync()
+        perf.startup.mark("catalog and journal")
+        for i in range(len(self.store.categories)):
+            cat = Category(self.store, i, update_callback=self.apply_delta, quantity_callback=self.open_quantity_entry)
             self.categories.append(cat)
             self.panel.add_widget(cat)
+        perf.startup.mark("categories")
 
         root.add_widget(self.panel)
 
@@ -301,175 +367,740 @@ class MainApp(App):
         totals_box.add_widget(self.total_addons_label)
         root.add_widget(totals_box)
 
-        # Menu popup
-        def open_menu(instance):
-            content = BoxLayout(orientation="vertical", spacing=4, padding=6)
-            btn1 = Button(text="Cashier Performance", size_hint_y=None, height=dp(36))
-            btn2 = Button(text="Save Report", size_hint_y=None, height=dp(36))
-            btn3 = Button(text="Load Report", size_hint_y=None, height=dp(36))
-            btn4 = Button(text="Cancel", size_hint_y=None, height=dp(36))
-
-            content.add_widget(btn1)
-            content.add_widget(btn2)
-            content.add_widget(btn3)
-            content.add_widget(btn4)
-
-            menu_popup = Popup(title="Menu", content=content, size_hint=(0.5, 0.5))
-            menu_popup.open()
-
-            btn1.bind(on_press=lambda x: (menu_popup.dismiss(), self.show_cashier_performance()))
-            btn2.bind(on_press=lambda x: (menu_popup.dismiss(), self.save_report()))
-
-            # Load report functionality
-            def load_report_btn(instance):
-                menu_popup.dismiss()
-                filechooser_layout = BoxLayout(orientation="vertical", spacing=6, padding=6)
-                filechooser = FileChooserListView(filters=['*.csv'], path='.', size_hint=(1, 0.9))
-                select_btn = Button(text="Select", size_hint=(1, 0.1))
-                filechooser_layout.add_widget(filechooser)
-                filechooser_layout.add_widget(select_btn)
-                chooser_popup = Popup(title="Load Report", content=filechooser_layout, size_hint=(0.9, 0.9))
-                chooser_popup.open()
-
-                def load_selected_file(instance):
-                    selection = filechooser.selection
-                    if selection:
-                        filename = selection[0]
-                        try:
-                            with open(filename, newline='') as file:
-                                reader = csv.DictReader(file)
-                                # Reset all counts first
-                                for cat in self.categories:
-                                    for row in cat.rows:
-                                        if hasattr(row, "medio_count"): row.medio_count = 0
-                                        if hasattr(row, "grande_count"): row.grande_count = 0
-                                        if hasattr(row, "fixed_count"): row.fixed_count = 0
-
-                                # Load CSV data
-                                for row_data in reader:
-                                    cat_name = row_data["Category"]
-                                    product = row_data["Product"]
-                                    medio = int(row_data.get("Medio", 0) or 0)
-                                    grande = int(row_data.get("Grande", 0) or 0)
-                                    fixed = int(row_data.get("Fixed", 0) or 0)
-
-                                    # Find category
-                                    cat = next((c for c in self.categories if c.text == cat_name), None)
-                                    if cat:
-                                        # Find product row
-                                        p_row = next((r for r in cat.rows if r.product == product), None)
-                                        if p_row:
-                                            if hasattr(p_row, "medio_count"):
-                                                p_row.medio_count = medio
-                                                p_row.medio_label.text = str(medio)
-                                            if hasattr(p_row, "grande_count"):
-                                                p_row.grande_count = grande
-                                                p_row.grande_label.text = str(grande)
-                                            if hasattr(p_row, "fixed_count"):
-                                                p_row.fixed_count = fixed
-                                                if hasattr(p_row, "fixed_label"):
-                                                    p_row.fixed_label.text = str(fixed)
-                                                if hasattr(p_row, "sale_label") and hasattr(p_row, "price_fixed"):
-                                                    p_row.sale_label.text = str(fixed * (p_row.price_fixed or 0))
-                            chooser_popup.dismiss()
-                            self.update_all()
-                            Popup(title="Loaded", content=Label(text=f"Report loaded from {filename}"),
-                                  size_hint=(0.6, 0.4)).open()
-                        except Exception as e:
-                            Popup(title="Error", content=Label(text=f"Failed to load file.\n{e}"),
-                                  size_hint=(0.6, 0.4)).open()
-
-                select_btn.bind(on_press=load_selected_file)
-
-            btn3.bind(on_press=load_report_btn)
-            btn4.bind(on_press=lambda x: menu_popup.dismiss())
-
-        menu_btn.bind(on_press=open_menu)
+        # Menu and report chooser popups are built on first use and then reused
+        self.menu_popup = None
+        self.chooser_popup = None
+        self.browse_popup = None
+        self.report_index = ReportIndex(self.reports_dir, self.store)
+        threading.Thread(target=self._open_report_index, daemon=True).start()
+        menu_btn.bind(on_press=self.open_menu)
 
         self.update_all()
+        perf.startup.mark("build")
         return root
 
+    def load_catalog(self):
+        # A catalog.json in the app's data directory overrides the bundled one, so
+        # prices can change without a new build
+        cache_path = os.path.join(self.user_data_dir, CACHE_NAME)
+        override = os.path.join(self.user_data_dir, CATALOG_NAME)
+        if os.path.exists(override):
+            try:
+                catalog = load_catalog(override, cache_path)
+                Logger.info(f"Catalog: version {catalog.version} from {override}")
+                return catalog
+            except CatalogError as e:
+                Logger.error(f"Catalog: ignoring {override} ({e})")
+        return load_catalog(cache_path=cache_path)
+
+    def _build_menu(self):
+        from kivy.uix.popup import Popup
+        content = BoxLayout(orientation="vertical", spacing=4, padding=6)
+        btn1 = Button(text="Cashier Performance", size_hint_y=None, height=dp(36))
+        btn2 = Button(text="Save Report", size_hint_y=None, height=dp(36))
+        btn3 = Button(text="Load Report", size_hint_y=None, height=dp(36))
+        peak_btn = Button(text="Peak Hours", size_hint_y=None, height=dp(36))
+        day_btn = Button(text="New Day", size_hint_y=None, height=dp(36))
+        btn4 = Button(text="Cancel", size_hint_y=None, height=dp(36))
+        self.perf_btn = Button(text="Performance", size_hint_y=None, height=dp(36))
+
+        content.add_widget(btn1)
+        content.add_widget(btn2)
+        content.add_widget(btn3)
+        content.add_widget(peak_btn)
+        content.add_widget(day_btn)
+        content.add_widget(btn4)
+
+        self.menu_popup = Popup(title="Menu", content=content, size_hint=(0.5, 0.7))
+
+        btn1.bind(on_press=lambda x: (self.menu_popup.dismiss(), self.show_cashier_performance()))
+        self.perf_btn.bind(on_press=lambda x: (self.menu_popup.dismiss(), self.show_perf_stats()))
+        btn2.bind(on_press=lambda x: (self.menu_popup.dismiss(), self.save_report()))
+        btn3.bind(on_press=lambda x: (self.menu_popup.dismiss(), self.open_report_chooser()))
+        peak_btn.bind(on_press=lambda x: (self.menu_popup.dismiss(), self.show_peak_hours()))
+        day_btn.bind(on_press=lambda x: (self.menu_popup.dismiss(), self.confirm_new_day(
+            "Save the counts so far as a report and start the new day from zero?")))
+        btn4.bind(on_press=lambda x: self.menu_popup.dismiss())
+
+    def open_menu(self, *args):
+        started = perf.recorder.start()
+        if self.menu_popup is None:
+            self._build_menu()
+        # The hidden Performance entry sits right under Cashier Performance while stats are on
+        content = self.menu_popup.content
+        if perf.recorder.enabled and self.perf_btn.parent is None:
+            content.add_widget(self.perf_btn, index=len(content.children) - 1)
+        elif not perf.recorder.enabled and self.perf_btn.parent is not None:
+            content.remove_widget(self.perf_btn)
+        self.menu_popup.open()
+        perf.recorder.stop("menu_open", started)
+
+    def _open_report_index(self):
+        self.report_index.open()
+        Clock.schedule_once(lambda dt: self._refresh_report_list())
+
+    def _rescan_report_index(self):
+        self.report_index.rescan()
+        Clock.schedule_once(lambda dt: self._refresh_report_list())
+
+    def _build_report_chooser(self):
+        from kivy.uix.popup import Popup
+        layout = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        self.report_list = ReportList(self._pick_report, size_hint=(1, 0.8))
+        self.report_preview = make_label("Pick a report", height=dp(48))
+        buttons = BoxLayout(size_hint_y=None, height=dp(40), spacing=6)
+        rescan_btn = Button(text="Rescan")
+        browse_btn = Button(text="Browse…")
+        merge_btn = Button(text="Merge into Current")
+        load_btn = Button(text="Load")
+        buttons.add_widget(rescan_btn)
+        buttons.add_widget(browse_btn)
+        buttons.add_widget(merge_btn)
+        buttons.add_widget(load_btn)
+        layout.add_widget(self.report_list)
+        layout.add_widget(self.report_preview)
+        layout.add_widget(buttons)
+        self.chooser_popup = Popup(title="Load Report", content=layout, size_hint=(0.9, 0.9))
+        self.selected_report = None
+        self._report_list_version = None
+
+        def load_selected_file(instance, merge=False):
+            if self.selected_report:
+                self.chooser_popup.dismiss()
+                # Index entries are names in reports_dir; browsed files are absolute paths
+                self.load_report(os.path.join(self.reports_dir, self.selected_report), merge=merge)
+
+        def rescan(instance):
+            # For reports copied in from elsewhere; only files missing from the index are read
+            self.report_preview.text = "Scanning for new reports..."
+            threading.Thread(target=self._rescan_report_index, daemon=True).start()
+
+        rescan_btn.bind(on_press=rescan)
+        browse_btn.bind(on_press=lambda x: self.open_report_browser())
+        load_btn.bind(on_press=load_selected_file)
+        merge_btn.bind(on_press=lambda x: load_selected_file(x, merge=True))
+
+    def _build_report_browser(self):
+        # Any CSV in any directory, for reports the index does not cover
+        from kivy.uix.filechooser import FileChooserListView
+        from kivy.uix.popup import Popup
+        layout = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        self.report_browser = FileChooserListView(filters=["*.csv"], path=self.reports_dir, size_hint=(1, 0.9))
+        buttons = BoxLayout(size_hint=(1, 0.1), spacing=6)
+        select_btn = Button(text="Select")
+        cancel_btn = Button(text="Cancel")
+        buttons.add_widget(select_btn)
+        buttons.add_widget(cancel_btn)
+        layout.add_widget(self.report_browser)
+        layout.add_widget(buttons)
+        self.browse_popup = Popup(title="Browse Reports", content=layout, size_hint=(0.9, 0.9))
+
+        def select(instance):
+            selection = self.report_browser.selection
+            if selection:
+                self.browse_popup.dismiss()
+                self._pick_report(os.path.abspath(selection[0]))
+
+        select_btn.bind(on_press=select)
+        cancel_btn.bind(on_press=lambda x: self.browse_popup.dismiss())
+
+    def open_report_browser(self):
+        if self.browse_popup is None:
+            self._build_report_browser()
+        else:
+            # Pick up files saved or copied in since it was last shown
+            self.report_browser._update_files()
+        self.browse_popup.open()
+
+    def open_report_chooser(self):
+        started = perf.recorder.start()
+        if self.chooser_popup is None:
+            self._build_report_chooser()
+        self._refresh_report_list()
+        self.chooser_popup.open()
+        perf.recorder.stop("chooser_open", started)
+
+    def _refresh_report_list(self):
+        if self.chooser_popup is None or self._report_list_version == self.report_index.version:
+            return
+        self._report_list_version = self.report_index.version
+        self.report_list.data = [
+            {"text": f"{entry['saved_at']}   {entry['cups']} cups   ₱{entry['sales']}", "filename": name}
+            for name, entry in self.report_index.newest_first()
+        ]
+        if self.report_preview.text.startswith("Scanning"):
+            self.report_preview.text = "Pick a report"
+
+    def _pick_report(self, filename):
+        self.selected_report = filename
+        entry = self.report_index.entries.get(filename)
+        if entry:
+            self.report_preview.text = (f"{filename}\n{entry['cups']} cups | {entry['addons']} add-ons | "
+                                        f"₱{entry['sales']}")
+        else:
+            self.report_preview.text = f"{filename}\nNot in the report index"
+
+    def on_start(self):
+        Clock.schedule_once(self._on_first_frame)
+        if self.prebuild_delay is not None:
+            Clock.schedule_once(self._prebuild_next_tab, self.prebuild_delay)
+
+    def _on_first_frame(self, dt):
+        total = perf.startup.mark("first frame")
+        Logger.info(f"Startup: {perf.startup.text()}")
+        if total > self.startup_budget:
+            Logger.warning(f"Startup: {total:.2f}s exceeds the {self.startup_budget:.2f}s budget")
+        self._check_day()
+
+    def on_pause(self):
+        self.journal.sync()
+        self._save_sync_state()
+        self._save_series()
+        return True
+
+    def on_resume(self):
+        self._check_day()
+
+    def _check_day(self):
+        # A tally left over from an earlier day is only cleared once the cashier agrees
+        today = day_of()
+        if self.journal.day == today or self._day_declined == today:
+            return
+        if not any(self.store.counts):
+            # Nothing to save: the day ended empty, or a synced terminal's New Day
+            # already saved the shared tally and zeroed it here
+            self.new_day()
+            return
+        self._day_declined = today
+        self.confirm_new_day(f"The counts are from {self._tally_day():%d %b %Y}.\n"
+                             f"Save them as that day's report and start today from zero?")
+
+    def _tally_day(self):
+        from datetime import date
+        day = self.journal.day or day_of()
+        return date(day // 10000, day // 100 % 100, day % 100)
+
+    def confirm_new_day(self, text):
+        from kivy.uix.popup import Popup
+        if self.sync:
+            text += "\nThe counts start over on every synced terminal."
+        content = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        content.add_widget(make_label(text))
+        buttons = BoxLayout(size_hint_y=None, height=dp(40), spacing=6)
+        start_btn = Button(text="New Day")
+        keep_btn = Button(text="Not Now")
+        buttons.add_widget(start_btn)
+        buttons.add_widget(keep_btn)
+        content.add_widget(buttons)
+        popup = Popup(title="New Day", content=content, size_hint=(0.8, 0.4))
+        start_btn.bind(on_press=lambda x: (popup.dismiss(), self.new_day()))
+        keep_btn.bind(on_press=lambda x: popup.dismiss())
+        popup.open()
+
+    def new_day(self):
+        # Saves the tally so far under the day it belongs to, then starts the
+        # counts, shifts and time series over
+        from datetime import datetime, time as day_time
+        day = self._tally_day()
+        when = datetime.now() if day == datetime.now().date() else datetime.combine(day, day_time(23, 59, 59))
+        if any(self.store.counts):
+            # The day's buckets go out with the report, before clear() below
+            self.save_report(when)
+        elif any(self.series.counts):
+            # Nothing left to report (another terminal's New Day already saved the
+            # shared tally), but this terminal's taps still belong to that day
+            path = hourly_path(self._report_path(when))
+            try:
+                write_hourly(path, self.series, self.series.counts)
+            except OSError as e:
+                Logger.warning(f"Series: failed to export {path} ({e})")
+        before = self.store.snapshot()
+        self.store.reset()
+        if self.sync:
+            # The terminals share one tally and the report above holds all of it, so
+            # the whole tally starts over everywhere: this terminal's share goes
+            # negative by the others' counts
+            self.sync.record_changes(before, self.store.counts)
+        self._start_day()
+        self.update_all()
+
+    def _start_day(self):
+        self.journal.start_day(day_of())
+        self._day_declined = None
+        self.shift_log.clear()
+        self.series.clear()
+        self._save_series()
+
+    def on_stop(self):
+        Clock.unschedule(self._flush_journal)
+        self.journal.close()
+        self._save_series()
+        if self.sync:
+            self._save_sync_state()
+            self.sync_transport.close()
+
+    def _flush_journal(self, dt):
+        self.journal.flush()
+        self._save_sync_state()
+        self._save_series()
+
+    def _save_series(self):
+        if not self.series.dirty:
+            return
+        try:
+            self.series.save(self._series_path)
+        except OSError as e:
+            Logger.warning(f"Series: failed to save ({e})")
+
+    def start_sync(self):
+        from sync import STATE_NAME, CountSync, UdpTransport, parse_peers
+        self.sync = CountSync(self.store)
+        self._sync_state_path = os.path.join(self.user_data_dir, STATE_NAME)
+        self._sync_saved_version = None
+        if self.sync.load(self._sync_state_path):
+            # The saved sync state is the authority on what every terminal counted
+            self.store.load(self.sync.shared_counts())
+            self.journal.compact()
+        else:
+            self.sync.adopt()
+        peers = parse_peers(self.sync_peers or os.environ.get("CUPS_SYNC_PEERS", ""))
+        try:
+            self.sync_transport = UdpTransport(self._on_sync_packet, self.sync_port, peers)
+        except OSError as e:
+            Logger.warning(f"Sync: disabled, cannot open port {self.sync_port} ({e})")
+            self.sync = None
+            return
+        Clock.schedule_interval(lambda dt: self._send_sync(), self.sync_interval)
+        Clock.schedule_interval(lambda dt: self._send_sync(full=True), self.sync_full_interval)
+        Logger.info(f"Sync: device {self.sync.device_id:x} on port {self.sync_port}")
+
+    def _send_sync(self, full=False):
+        self.sync_transport.send(self.sync.packets(full=full))
+
+    def _on_sync_packet(self, data):
+        # Called on the transport's thread; counts are only ever changed on the UI thread
+        Clock.schedule_once(lambda dt: self._apply_sync_packet(data))
+
+    def _apply_sync_packet(self, data):
+        changes = self.sync.receive(data)
+        for slot, delta in changes:
+            self.journal.record(slot, delta)
+            self._dirty_categories.add(self.categories[self.store.slot_category[slot]])
+            self._mark_totals(slot)
+        if changes:
+            self._refresh_trigger()
+
+    def _save_sync_state(self):
+        if self.sync is None or self._sync_saved_version == self.sync.version:
+            return
+        try:
+            self.sync.save(self._sync_state_path)
+            self._sync_saved_version = self.sync.version
+        except OSError as e:
+            Logger.warning(f"Sync: failed to save state ({e})")
+
+    def set_perf_enabled(self, enabled):
+        perf.recorder.enabled = enabled
+        Clock.unschedule(self._record_frame)
+        if enabled:
+            Clock.schedule_interval(self._record_frame, 0)
+
+    def _record_frame(self, dt):
+        perf.recorder.record("frame", dt)
+
+    def _on_title_touch(self, instance, touch):
+        # Five quick taps on the title switch the hidden performance stats on or off
+        if not instance.collide_point(*touch.pos):
+            return False
+        now = Clock.get_time()
+        self._title_taps = [t for t in self._title_taps if now - t < 3] + [now]
+        if len(self._title_taps) >= 5:
+            self._title_taps = []
+            self.set_perf_enabled(not perf.recorder.enabled)
+            state = "on" if perf.recorder.enabled else "off"
+            show_message("Performance", f"Performance stats {state}", size_hint=(0.5, 0.3))
+        return False
+
+    def show_perf_stats(self):
+        from kivy.uix.popup import Popup
+        content = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        stats = make_label(f"{perf.startup.text()}\n\n{perf.recorder.text()}")
+        dump_btn = Button(text="Dump to File", size_hint_y=None, height=dp(36))
+        reset_btn = Button(text="Reset", size_hint_y=None, height=dp(36))
+        close_btn = Button(text="Close", size_hint_y=None, height=dp(36))
+        content.add_widget(stats)
+        content.add_widget(dump_btn)
+        content.add_widget(reset_btn)
+        content.add_widget(close_btn)
+        popup = Popup(title="Performance", content=content, size_hint=(0.9, 0.9))
+        popup.open()
+
+        def dump(instance):
+            # Next to the saved reports, so it can be pulled off the device the same way
+            filename = os.path.join(self.reports_dir, time.strftime("perf_%Y%m%d_%H%M%S.json"))
+            try:
+                perf.recorder.dump(filename)
+                stats.text = f"Saved to {filename}\n\n{perf.recorder.text()}"
+            except OSError as e:
+                stats.text = f"Failed to save stats.\n{e}"
+
+        def reset(instance):
+            perf.recorder.reset()
+            stats.text = perf.recorder.text()
+
+        dump_btn.bind(on_press=dump)
+        reset_btn.bind(on_press=reset)
+        close_btn.bind(on_press=lambda x: popup.dismiss())
+
+    def _prebuild_next_tab(self, dt):
+        # One tab per frame so the UI stays responsive while the rest are built
+        for cat in self.categories:
+            if not cat.built:
+                cat.ensure_built()
+                Clock.schedule_once(self._prebuild_next_tab)
+                return
+
+    def load_report(self, filename, merge=False):
+        # Parse off the UI thread, then swap (or add) the counts in as one batch
+        started = perf.recorder.start()
+
+        def worker():
+            try:
+                counts, problems = read_report(filename, self.store)
+            except (OSError, ReportError) as e:
+                message = f"Failed to load file.\n{e}"
+                Clock.schedule_once(lambda dt: show_message("Error", message))
+                return
+            Clock.schedule_once(lambda dt: self._apply_loaded_report(filename, counts, problems, started, merge))
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _apply_loaded_report(self, filename, counts, problems, started=None, merge=False):
+        before = self.store.snapshot()
+        if merge:
+            self.store.merge(counts)
+        else:
+            self.store.load(counts)
+            self.shift_log.clear()
+        self.journal.compact()
+        if self.sync:
+            # Counted as this terminal's own, so the other terminals pick it up too
+            self.sync.record_changes(before, self.store.counts)
+        self.update_all()
+        perf.recorder.stop("load", started)
+        text = f"Report {'merged' if merge else 'loaded'} from {filename}"
+        if problems:
+            text += f"\n{len(problems)} row(s) skipped:\n" + "\n".join(problems[:5])
+            if len(problems) > 5:
+                text += "\n..."
+        show_message("Loaded", text)
+
+    def describe_slot(self, slot):
+        store = self.store
+        spec = store.categories[store.slot_category[slot]]
+        size = SIZES[store.slot_size[slot]]
+        return f"{spec.name} {store.slot_product[slot]}" + ("" if size == "fixed" else f" {size.capitalize()}")
+
+    def _build_quantity_popup(self):
+        from kivy.uix.popup import Popup
+        from kivy.uix.textinput import TextInput
+        content = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        self.quantity_input = TextInput(hint_text=QUANTITY_HINT, input_filter="int",
+                                        multiline=False, size_hint_y=None, height=dp(36))
+        picks = BoxLayout(size_hint_y=None, height=dp(36), spacing=4)
+        for n in (2, 5, 10, 20, 25, 50):
+            btn = Button(text=str(n))
+            btn.bind(on_press=lambda x: setattr(self.quantity_input, "text", x.text))
+            picks.add_widget(btn)
+        buttons = BoxLayout(size_hint_y=None, height=dp(40), spacing=6)
+        add_btn = Button(text="Add Now")
+        queue_btn = Button(text="Add to Order")
+        cancel_btn = Button(text="Cancel")
+        buttons.add_widget(add_btn)
+        buttons.add_widget(queue_btn)
+        buttons.add_widget(cancel_btn)
+        content.add_widget(self.quantity_input)
+        content.add_widget(picks)
+        content.add_widget(buttons)
+        self.quantity_popup = Popup(content=content, size_hint=(0.8, 0.4))
+
+        def entered():
+            # None, leaving the popup open, when the quantity is out of range
+            try:
+                quantity = int(self.quantity_input.text)
+            except ValueError:
+                return 0
+            if abs(quantity) > self.max_quantity:
+                self.quantity_input.text = ""
+                self.quantity_input.hint_text = f"At most {self.max_quantity} at a time"
+                return None
+            return quantity
+
+        def add_now(instance):
+            quantity = entered()
+            if quantity is None:
+                return
+            self.quantity_popup.dismiss()
+            if quantity:
+                self.apply_batch([(self._quantity_slot, quantity)])
+
+        def add_to_order(instance):
+            quantity = entered()
+            if quantity is None:
+                return
+            self.quantity_popup.dismiss()
+            if quantity:
+                self.order.append((self._quantity_slot, quantity))
+                self._update_order_button()
+
+        add_btn.bind(on_press=add_now)
+        queue_btn.bind(on_press=add_to_order)
+        cancel_btn.bind(on_press=lambda x: self.quantity_popup.dismiss())
+
+    def open_quantity_entry(self, slot):
+        if self.quantity_popup is None:
+            self._build_quantity_popup()
+        self._quantity_slot = slot
+        self.quantity_popup.title = f"{self.describe_slot(slot)} (now {self.store.counts[slot]})"
+        self.quantity_input.text = ""
+        self.quantity_input.hint_text = QUANTITY_HINT
+        self.quantity_popup.open()
+
+    def _update_order_button(self):
+        if self.order:
+            self.order_btn.text = f"Order ({len(self.order)})"
+            if self.order_btn.parent is None:
+                self.header.add_widget(self.order_btn, index=1)
+        elif self.order_btn.parent is not None:
+            self.header.remove_widget(self.order_btn)
+
+    def show_order(self):
+        from kivy.uix.popup import Popup
+        lines = [f"{self.describe_slot(slot)} x {quantity}" for slot, quantity in self.order]
+        cups = sum(quantity for slot, quantity in self.order if not self.store.slot_addons[slot])
+        sales = sum(quantity * self.store.prices[slot] for slot, quantity in self.order)
+        content = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        content.add_widget(make_label("\n".join(lines) + f"\n\n{cups} cups | ₱{sales}"))
+        buttons = BoxLayout(size_hint_y=None, height=dp(40), spacing=6)
+        commit_btn = Button(text="Commit")
+        clear_btn = Button(text="Clear")
+        close_btn = Button(text="Close")
+        buttons.add_widget(commit_btn)
+        buttons.add_widget(clear_btn)
+        buttons.add_widget(close_btn)
+        content.add_widget(buttons)
+        popup = Popup(title="Order", content=content, size_hint=(0.8, 0.7))
+
+        def commit(instance):
+            self.apply_batch(self.order)
+            clear(instance)
+
+        def clear(instance):
+            self.order = []
+            self._update_order_button()
+            popup.dismiss()
+
+        commit_btn.bind(on_press=commit)
+        clear_btn.bind(on_press=clear)
+        close_btn.bind(on_press=lambda x: popup.dismiss())
+        popup.open()
+
+    def show_peak_hours(self):
+        from kivy.uix.popup import Popup
+        totals = self.series.bucket_totals()
+        labels = bucket_labels(self.series.interval)
+        busiest = ", ".join(labels[b] for b in peaks(totals))
+        lines = bar_lines(totals, self.series.interval, width=20, mark="|")
+        text = f"Busiest today: {busiest}\n\n" + "\n".join(lines) if lines else "No taps recorded today yet."
+        content = BoxLayout(orientation="vertical", spacing=6, padding=6)
+        chart = Label(text=text, font_name="RobotoMono-Regular", halign="left", valign="top")
+        chart.bind(size=lambda inst, val: setattr(inst, "text_size", (inst.width, inst.height)))
+        close_btn = Button(text="Close", size_hint_y=None, height=dp(36))
+        content.add_widget(chart)
+        content.add_widget(close_btn)
+        popup = Popup(title="Peak Hours", content=content, size_hint=(0.9, 0.9))
+        close_btn.bind(on_press=lambda x: popup.dismiss())
+        popup.open()
+
     def show_cashier_performance(self):
+        from kivy.uix.popup import Popup
+        from kivy.uix.textinput import TextInput
         popup_content = BoxLayout(orientation="vertical", spacing=6, padding=6)
         date_input = TextInput(hint_text="Enter date", size_hint_y=None, height=dp(36))
         cashier_input = TextInput(hint_text="Enter cashier", size_hint_y=None, height=dp(36))
         submit_btn = Button(text="Generate", size_hint_y=None, height=dp(36))
-        popup_content.add_widget(Label(text="CASHIER PERFORMANCE"))
+        handover_btn = Button(text="End Shift", size_hint_y=None, height=dp(36))
+        all_btn = Button(text="Copy All Shifts", size_hint_y=None, height=dp(36))
+        closed = len(self.shift_log.snapshots)
+        popup_content.add_widget(Label(text=f"CASHIER PERFORMANCE\n{closed} shift(s) ended so far", halign="center"))
         popup_content.add_widget(date_input)
         popup_content.add_widget(cashier_input)
         popup_content.add_widget(submit_btn)
-        popup = Popup(title="Cashier Performance", content=popup_content, size_hint=(0.6, 0.6))
+        popup_content.add_widget(handover_btn)
+        popup_content.add_widget(all_btn)
+        popup = Popup(title="Cashier Performance", content=popup_content, size_hint=(0.6, 0.7))
         popup.open()
 
-        def generate_report(instance):
-            total_cups = sum(cat.last_totals["cups"] for cat in self.categories if cat.kind != "addons")
-            total_addons = sum(cat.last_totals["cups"] for cat in self.categories if cat.kind == "addons")
-            special_drinks = next(cat.last_totals["cups"] for cat in self.categories if cat.text == "Special Drinks")
-
-            # --- Secret Menu ---
-            secret_cat = next(cat for cat in self.categories if cat.text == "Secret Menu")
-            bv_total = sum(getattr(r, "fixed_count", 0) for r in secret_cat.rows)
-            brownie_count = next((r.fixed_count for r in secret_cat.rows if r.product == "BROWNIE"), 0)
-            crazy_count = next((r.fixed_count for r in secret_cat.rows if r.product == "CRAZY"), 0)
-
-            report_text = (
-                f"CASHIER PERFORMANCE\n"
-                f"DATE: {date_input.text}\n\n"
-                f"🟤 San Vicente ({total_cups})\n"
-                f"CASHIER: {cashier_input.text}\n"
-                f"AO: {total_addons}\n"
-                f"SD: {special_drinks}\n"
-                f"BV: {bv_total}\n\n"
-                f"BROWNIE: {brownie_count}\n"
-                f"CRAZY : {crazy_count}"
-            )
-
-            Clipboard.copy(report_text)
+        def copy(shifts):
+            from kivy.core.clipboard import Clipboard
+            Clipboard.copy(performance_text(date_input.text, shifts))
             popup.dismiss()
-            Popup(title="Copied", content=Label(text="Cashier performance copied to clipboard!"),
-                  size_hint=(0.5, 0.3)).open()
+            show_message("Copied", "Cashier performance copied to clipboard!", size_hint=(0.5, 0.3))
+
+        def generate_report(instance):
+            # Everything since the last handover
+            copy([self.shift_log.current(cashier_input.text)])
+
+        def end_shift(instance):
+            try:
+                shift = self.shift_log.handover(cashier_input.text)
+            except OSError as e:
+                show_message("Error", f"Failed to record the handover.\n{e}")
+                return
+            if self.history_enabled:
+                threading.Thread(target=self._record_shift, daemon=True,
+                                 args=(shift, self.shift_log.counts_of(-1))).start()
+            copy([shift])
+
+        def copy_all(instance):
+            shifts = self.shift_log.shifts()
+            current = self.shift_log.current(cashier_input.text)
+            if any(current.figures) or not shifts:
+                shifts.append(current)
+            copy(shifts)
 
         submit_btn.bind(on_press=generate_report)
+        handover_btn.bind(on_press=end_shift)
+        all_btn.bind(on_press=copy_all)
 
-    def save_report(self):
-        filename = f"cups_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        with open(filename, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Category", "Product", "Medio", "Grande", "Fixed", "Sale"])
-            for cat in self.categories:
-                for row in cat.rows:
-                    medio = getattr(row, "medio_count", "")
-                    grande = getattr(row, "grande_count", "")
-                    fixed = getattr(row, "fixed_count", "")
-                    sale = 0
-                    if hasattr(row, "price_medio"):
-                        sale += getattr(row, "medio_count", 0) * (row.price_medio or 0)
-                    if hasattr(row, "price_grande"):
-                        sale += getattr(row, "grande_count", 0) * (row.price_grande or 0)
-                    if hasattr(row, "fixed_count") and hasattr(row, "price_fixed"):
-                        sale += getattr(row, "fixed_count", 0) * (row.price_fixed or 0)
-                    writer.writerow([cat.text, row.product, medio, grande, fixed, sale])
-        Popup(title="Saved", content=Label(text=f"Report saved to {filename}"), size_hint=(0.6, 0.4)).open()
+    def save_report(self, now=None):
+        from datetime import datetime
+        if now is None:
+            now = datetime.now()
+        filename = self._report_path(now)
+        meta = {"saved_at": now, "started": perf.recorder.start(),
+                "series": self.series.counts[:]}
+        self.saver.save(filename, self.store.snapshot(), meta)
 
-    def update_all(self, *args):
-        total_drink_cups = 0
-        total_sales_all = 0
-        addons_cups_total = 0
-        addons_sales_total = 0
+    def _report_path(self, when):
+        return os.path.join(self.reports_dir, f"cups_report_{when.strftime('%Y%m%d_%H%M%S')}.csv")
 
-        for cat in self.categories:
-            t = cat.update_totals()
-            if cat.kind == "addons":
-                addons_cups_total = t.get("cups", 0)
-                addons_sales_total = t.get("sales", 0)
-                total_sales_all += addons_sales_total
+    def _after_report_written(self, filename, counts, meta):
+        # Runs on the save worker, which is also where the history database is first opened
+        self.report_index.add(filename, counts)
+        try:
+            write_hourly(hourly_path(filename), self.series, meta["series"])
+        except OSError as e:
+            Logger.warning(f"Series: failed to export {hourly_path(filename)} ({e})")
+        if not self.history_enabled:
+            return
+        import sqlite3
+        try:
+            self._open_history().add_counts(filename, meta["saved_at"], self.store, counts)
+        except sqlite3.Error as e:
+            Logger.warning(f"History: failed to record {filename} ({e})")
+
+    def _open_history(self):
+        from history import HISTORY_NAME, HistoryStore
+        if self.history is None:
+            self.history = HistoryStore(os.path.join(self.user_data_dir, HISTORY_NAME))
+        return self.history
+
+    def _record_shift(self, shift, counts):
+        # Runs on its own thread; per-cashier history figures come from these
+        # shift deltas rather than from the saved reports' running tally
+        import sqlite3
+        from history import branch_name
+        try:
+            self._open_history().add_shift(branch_name(self.reports_dir), shift.cashier, shift.started, shift.ended,
+                                           self.store, counts)
+        except sqlite3.Error as e:
+            Logger.warning(f"History: failed to record the shift of {shift.cashier} ({e})")
+
+    def _on_report_saved(self, filename, error, meta):
+        def show(dt):
+            perf.recorder.stop("save", meta["started"])
+            if error:
+                show_message("Error", f"Failed to save report.\n{error}")
             else:
-                total_drink_cups += t.get("cups", 0)
-                total_sales_all += t.get("sales", 0)
+                show_message("Saved", f"Report saved to {filename}")
+
+        Clock.schedule_once(show)
+
+    def update_all(self, *args):
+        # Full refresh from the store; only needed after a report is loaded or the counts are reset
+        started = perf.recorder.start()
+        for cat in self.categories:
+            cat.update_totals()
+        self._refresh_cups_label()
+        self._refresh_sales_label()
+        self._refresh_addons_label()
+        perf.recorder.stop("update_all", started)
+
+    def apply_delta(self, cat, row, slot, delta):
+        if self._oldest_tap is None:
+            self._oldest_tap = perf.recorder.start()
+        self.journal.record(slot, delta)
+        self.series.record(slot, delta)
+        if self.sync:
+            correction = self.sync.record(slot, delta)
+            if correction:
+                self.journal.record(slot, correction)
+        self._dirty_rows.add(row)
+        self._dirty_buckets.add((cat, self.store.slot_bucket[slot]))
+        self._mark_totals(slot)
+        self._refresh_trigger()
+
+    def apply_batch(self, items):
+        # A whole order at once: one journal write and one refresh for all of it
+        started = perf.recorder.start()
+        applied = self.store.apply_many(items)
+        records = list(applied)
+        for slot, delta in applied:
+            self.series.record(slot, delta)
+            if self.sync:
+                correction = self.sync.record(slot, delta)
+                if correction:
+                    records.append((slot, correction))
+            self._dirty_categories.add(self.categories[self.store.slot_category[slot]])
+            self._mark_totals(slot)
+        self.journal.record_many(records)
+        if applied:
+            self._refresh_trigger()
+        perf.recorder.stop("batch", started)
+        return applied
+
+    def _mark_totals(self, slot):
+        self._dirty_totals.add(self._refresh_addons_label if self.store.slot_addons[slot] else self._refresh_cups_label)
+        if self.store.prices[slot]:
+            self._dirty_totals.add(self._refresh_sales_label)
+
+    def _flush_refresh(self, *args):
+        # Redraws everything touched since the last frame in one pass
+        rows, self._dirty_rows = self._dirty_rows, set()
+        buckets, self._dirty_buckets = self._dirty_buckets, set()
+        totals, self._dirty_totals = self._dirty_totals, set()
+        categories, self._dirty_categories = self._dirty_categories, set()
+        for cat in categories:
+            # Changed by another terminal, so there is no row to point at
+            cat.update_totals()
+        for row in rows:
+            row.refresh()
+        for cat, bucket in buckets:
+            cat.refresh_bucket(bucket)
+        for refresh in totals:
+            refresh()
+        perf.recorder.stop("tap_to_totals", self._oldest_tap)
+        self._oldest_tap = None
+
+    def _refresh_cups_label(self):
+        self.total_cups_label.text = f"Total Cups: {self.store.drink_cups}"
+
+    def _refresh_sales_label(self):
+        self.total_sales_label.text = f"Total Sales: ₱{self.store.sales}"
 
-        self.total_cups_label.text = f"Total Cups: {total_drink_cups}"
-        self.total_sales_label.text = f"Total Sales: ₱{total_sales_all}"
-        self.total_addons_label.text = f"Total Add-ons: {addons_cups_total} | ₱{addons_sales_total}"
+    def _refresh_addons_label(self):
+        self.total_addons_label.text = f"Total Add-ons: {self.store.addons_cups} | ₱{self.store.addons_sales}"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,199 @@
+from array import array
+
+
+SIZES = ("medio", "grande", "fixed")
+MEDIO, GRANDE, FIXED = range(3)
+
+# Each category owns two totals buckets: medio/grande for "size" tabs,
+# AO/ES for the add-ons tab and a single one for fixed-price tabs.
+BUCKETS_PER_CATEGORY = 2
+
+
+class CategorySpec:
+    __slots__ = ("name", "kind", "products", "price_medio", "price_grande", "fixed_prices")
+
+    def __init__(self, name, products, kind="size", price_medio=None, price_grande=None, fixed_prices=None):
+        self.name = name
+        self.kind = kind
+        self.products = list(products)
+        self.price_medio = price_medio
+        self.price_grande = price_grande
+        self.fixed_prices = dict(fixed_prices or {})
+
+
+# Counts and prices for every (category, product, size) slot of the menu. Slots are
+# laid out category by category, so each category owns one contiguous range, and
+# running totals per bucket and for the whole app are kept in step by ``apply``.
+class CountStore:
+    __slots__ = ("categories", "aliases", "index", "product_index", "cat_ranges", "slot_category", "slot_size", "slot_bucket", "slot_addons",
+                 "slot_product", "prices", "counts", "bucket_cups", "bucket_sales", "drink_cups", "sales", "addons_cups",
+                 "addons_sales")
+
+    def __init__(self, categories, aliases=None):
+        self.categories = list(categories)
+        # (old category, old product) -> (category, product), see catalog.py
+        self.aliases = aliases or {}
+        self.index = {}
+        self.product_index = {}
+        self.cat_ranges = []
+        self.slot_category = array("H")
+        self.slot_size = array("B")
+        self.slot_bucket = array("H")
+        self.slot_addons = array("B")
+        self.slot_product = []
+        self.prices = array("l")
+
+        for ci, spec in enumerate(self.categories):
+            start = len(self.prices)
+            for product in spec.products:
+                if spec.kind == "size":
+                    self._add_slot(ci, spec, product, MEDIO, spec.price_medio, 0)
+                    self._add_slot(ci, spec, product, GRANDE, spec.price_grande, 1)
+                else:
+                    bucket = 1 if spec.kind == "addons" and product == "ES" else 0
+                    self._add_slot(ci, spec, product, FIXED, spec.fixed_prices.get(product), bucket)
+            self.cat_ranges.append((start, len(self.prices)))
+
+        self.counts = array("l", bytes(len(self.prices) * self.prices.itemsize))
+        self.bucket_cups = array("l", bytes(len(self.categories) * BUCKETS_PER_CATEGORY * self.prices.itemsize))
+        self.bucket_sales = array("l", self.bucket_cups)
+        self.drink_cups = 0
+        self.sales = 0
+        self.addons_cups = 0
+        self.addons_sales = 0
+
+    def _add_slot(self, ci, spec, product, size, price, bucket):
+        self.index[(spec.name, product, SIZES[size])] = len(self.prices)
+        self.product_index.setdefault((spec.name, product), {})[SIZES[size]] = len(self.prices)
+        self.slot_category.append(ci)
+        self.slot_size.append(size)
+        self.slot_bucket.append(ci * BUCKETS_PER_CATEGORY + bucket)
+        self.slot_addons.append(spec.kind == "addons")
+        self.slot_product.append(product)
+        self.prices.append(price or 0)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def slot(self, category, product, size):
+        return self.index.get((category, product, size))
+
+    def lookup(self, category, product):
+        # {size: slot} of a product, also under its old names; None if unknown
+        key = (category, product)
+        return self.product_index.get(self.aliases.get(key, key))
+
+    def product_slots(self, ci, product):
+        return self.product_index[(self.categories[ci].name, product)]
+
+    def sale(self, slot):
+        return self.counts[slot] * self.prices[slot]
+
+    def apply(self, slot, delta):
+        # Counts never go below zero; the delta actually applied is returned
+        count = self.counts[slot]
+        if count + delta < 0:
+            delta = -count
+        if delta:
+            self.counts[slot] = count + delta
+            self._add_totals(slot, delta)
+        return delta
+
+    def apply_many(self, items):
+        # [(slot, delta), ...] in one go; returns the non-zero deltas actually applied
+        applied = []
+        for slot, delta in items:
+            delta = self.apply(slot, delta)
+            if delta:
+                applied.append((slot, delta))
+        return applied
+
+    def _add_totals(self, slot, delta):
+        sales = delta * self.prices[slot]
+        bucket = self.slot_bucket[slot]
+        self.bucket_cups[bucket] += delta
+        self.bucket_sales[bucket] += sales
+        self.sales += sales
+        if self.slot_addons[slot]:
+            self.addons_cups += delta
+            self.addons_sales += sales
+        else:
+            self.drink_cups += delta
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.recompute()
+
+    def load(self, counts):
+        if len(counts) != len(self.counts):
+            raise ValueError(f"expected {len(self.counts)} counts, got {len(counts)}")
+        self.counts = array("l", counts)
+        self.recompute()
+
+    def merge(self, counts):
+        # Adds a counts array of the same layout, e.g. another terminal's report
+        if len(counts) != len(self.counts):
+            raise ValueError(f"expected {len(self.counts)} counts, got {len(counts)}")
+        for slot, count in enumerate(counts):
+            if count:
+                self.apply(slot, count)
+
+    def snapshot(self):
+        return array("l", self.counts)
+
+    def recompute(self):
+        for i in range(len(self.bucket_cups)):
+            self.bucket_cups[i] = 0
+            self.bucket_sales[i] = 0
+        self.drink_cups = self.sales = self.addons_cups = self.addons_sales = 0
+        counts = self.counts
+        for slot in range(len(counts)):
+            if counts[slot]:
+                self._add_totals(slot, counts[slot])
+
+    def totals_of(self, counts):
+        # (drink cups, add-on cups, sales) of a counts array laid out like this store
+        drinks = addons = sales = 0
+        prices = self.prices
+        slot_addons = self.slot_addons
+        for slot, count in enumerate(counts):
+            if count:
+                if slot_addons[slot]:
+                    addons += count
+                else:
+                    drinks += count
+                sales += count * prices[slot]
+        return drinks, addons, sales
+
+    def bucket_totals(self, bucket):
+        return self.bucket_cups[bucket], self.bucket_sales[bucket]
+
+    def category_totals(self, ci):
+        first = ci * BUCKETS_PER_CATEGORY
+        cups = sum(self.bucket_cups[first:first + BUCKETS_PER_CATEGORY])
+        sales = sum(self.bucket_sales[first:first + BUCKETS_PER_CATEGORY])
+        return cups, sales
+
+    def category_index(self, name):
+        for ci, spec in enumerate(self.categories):
+            if spec.name == name:
+                return ci
+        return None
+
+    def report_rows(self, counts=None):
+        # One row per product in the saved-report layout; absent sizes stay blank
+        if counts is None:
+            counts = self.counts
+        prices = self.prices
+        for ci, spec in enumerate(self.categories):
+            start, end = self.cat_ranges[ci]
+            step = 2 if spec.kind == "size" else 1
+            for slot in range(start, end, step):
+                if step == 2:
+                    medio, grande = counts[slot], counts[slot + 1]
+                    sale = medio * prices[slot] + grande * prices[slot + 1]
+                    yield spec.name, self.slot_product[slot], medio, grande, "", sale
+                else:
+                    fixed = counts[slot]
+                    yield spec.name, self.slot_product[slot], "", "", fixed, fixed * prices[slot]
@@ -0,0 +1,138 @@
+import json
+import time
+from array import array
+
+
+# Histogram buckets are powers of two in microseconds: bucket i holds [2**(i-1), 2**i) µs
+BUCKETS = 32
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = array("L", bytes(BUCKETS * array("L").itemsize))
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def record(self, seconds):
+        us = int(seconds * 1e6)
+        self.counts[min(us.bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given fraction of samples, in seconds
+        if not self.count:
+            return 0.0
+        target = fraction * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min((1 << i) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "min_ms": (self.min or 0.0) * 1e3,
+            "p50_ms": self.percentile(0.5) * 1e3,
+            "p95_ms": self.percentile(0.95) * 1e3,
+            "p99_ms": self.percentile(0.99) * 1e3,
+            "max_ms": self.max * 1e3,
+            "buckets_us": {str(1 << i): n for i, n in enumerate(self.counts) if n},
+        }
+
+
+class Recorder:
+    # Latency histograms by name. While disabled, ``start`` returns None and
+    # ``stop`` returns straight away, so instrumented code pays two calls.
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+
+    def start(self):
+        return time.perf_counter() if self.enabled else None
+
+    def stop(self, name, started):
+        if started is None:
+            return
+        self.record(name, time.perf_counter() - started)
+
+    def record(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.record(seconds)
+
+    def reset(self):
+        self.histograms = {}
+
+    def summary(self):
+        return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def text(self):
+        if not self.histograms:
+            return "No samples yet."
+        lines = []
+        for name, s in self.summary().items():
+            lines.append(f"{name}: n={s['count']} p50={s['p50_ms']:.1f} p95={s['p95_ms']:.1f} "
+                         f"max={s['max_ms']:.1f} ms")
+        return "\n".join(lines)
+
+    def dump(self, path):
+        with open(path, "w") as file:
+            json.dump({"time": time.strftime("%Y-%m-%d %H:%M:%S"), "histograms": self.summary(),
+                       "startup": startup.summary()}, file, indent=2)
+
+
+class StartupTimer:
+    # Wall-clock marks since process start, always on: a handful of
+    # perf_counter calls per launch
+    def __init__(self):
+        self.reset()
+
+    def reset(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.last = self.started
+        self.phases = []
+        self.tabs = {}
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+        return now - self.started
+
+    def tab_built(self, name, seconds):
+        # Tabs build on first selection or during the idle prebuild, outside the phase sequence
+        self.tabs[name] = seconds
+
+    @property
+    def total(self):
+        return self.last - self.started
+
+    def summary(self):
+        return {"total_ms": self.total * 1e3,
+                "phases_ms": {name: seconds * 1e3 for name, seconds in self.phases},
+                "tabs_ms": {name: seconds * 1e3 for name, seconds in self.tabs.items()}}
+
+    def text(self):
+        lines = [f"startup: {self.total * 1e3:.0f} ms"]
+        lines.extend(f"  {name}: {seconds * 1e3:.1f} ms" for name, seconds in self.phases)
+        if self.tabs:
+            lines.append("tab builds: " + ", ".join(f"{name} {seconds * 1e3:.0f}" for name, seconds in
+                                                   self.tabs.items()) + " ms")
+        return "\n".join(lines)
+
+
+recorder = Recorder()
+startup = StartupTimer()
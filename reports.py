@@ -0,0 +1,235 @@
+import json
+import os
+import re
+import threading
+from array import array
+
+from model import SIZES
+
+
+REPORT_HEADER = ["Category", "Product", "Medio", "Grande", "Fixed", "Sale"]
+REPORT_NAME = re.compile(r"cups_report_(\d{8})_(\d{6})\.csv$")
+INDEX_NAME = "cups_reports_index.json"
+
+
+class ReportError(Exception):
+    pass
+
+
+def read_report(path, store):
+    # Parses a saved report into a fresh counts array laid out like ``store``.
+    # Nothing in the store is touched; unknown and malformed rows are skipped
+    # and returned as problems so the caller can show them.
+    import csv
+    counts = array("l", bytes(len(store) * store.counts.itemsize))
+    problems = []
+    lookup = store.lookup
+
+    try:
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader, None)
+            if not header:
+                raise ReportError("The file is empty.")
+            columns = {name.strip(): i for i, name in enumerate(header)}
+            missing = [name for name in ("Category", "Product") if name not in columns]
+            if missing:
+                raise ReportError(f"Missing column(s): {', '.join(missing)}")
+            cat_col = columns["Category"]
+            product_col = columns["Product"]
+            size_cols = [(size, columns.get(size.capitalize())) for size in SIZES]
+
+            for line_no, row in enumerate(reader, start=2):
+                if not row:
+                    continue
+                try:
+                    key = (row[cat_col], row[product_col])
+                except IndexError:
+                    problems.append(f"line {line_no}: too few columns")
+                    continue
+                slots = lookup(*key)
+                if slots is None:
+                    problems.append(f"line {line_no}: unknown product {key[0]} / {key[1]}")
+                    continue
+                values = {}
+                for size, col in size_cols:
+                    if size not in slots or col is None or col >= len(row):
+                        continue
+                    text = row[col].strip()
+                    try:
+                        value = int(text) if text else 0
+                    except ValueError:
+                        value = -1
+                    if value < 0:
+                        problems.append(f"line {line_no}: bad {size} count {text!r} for {key[1]}")
+                        break
+                    values[slots[size]] = value
+                else:
+                    for slot, value in values.items():
+                        counts[slot] = value
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise ReportError(f"Not a readable report ({e})")
+    return counts, problems
+
+
+def write_report(path, store, counts):
+    # Written to a temporary file first and renamed over ``path``, so a crash
+    # mid-write never leaves a truncated report behind
+    import csv
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(REPORT_HEADER)
+        writer.writerows(store.report_rows(counts))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+class ReportSaver:
+    # Runs saves on a background thread, one at a time. Requests made while a
+    # save is running are queued in order; a newer request for a file that is
+    # still queued replaces it, so repeated saves of one report collapse into a
+    # single save of the newest snapshot. ``after_write(path, counts, meta)`` and
+    # ``on_done(path, error, meta)`` are called from the worker thread; anything
+    # raised while writing or in ``after_write`` is passed to ``on_done`` as the error.
+    def __init__(self, store, on_done, after_write=None):
+        self.store = store
+        self.on_done = on_done
+        self.after_write = after_write
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = {}
+
+    def save(self, path, counts, meta=None):
+        job = (path, counts, meta)
+        with self._lock:
+            if self._running:
+                self._pending[path] = job
+                return False
+            self._running = True
+        threading.Thread(target=self._run, args=(job,), daemon=True).start()
+        return True
+
+    def _next(self):
+        # Called with the lock held; the oldest queued save, or None when done
+        if not self._pending:
+            self._running = False
+            return None
+        return self._pending.pop(next(iter(self._pending)))
+
+    def _run(self, job):
+        try:
+            while job:
+                path, counts, meta = job
+                try:
+                    write_report(path, self.store, counts)
+                    if self.after_write:
+                        self.after_write(path, counts, meta)
+                    error = None
+                except Exception as e:
+                    error = e
+                self.on_done(path, error, meta)
+                with self._lock:
+                    job = self._next()
+        finally:
+            if job:
+                # ``on_done`` raised; the queued saves carry on on a fresh thread
+                with self._lock:
+                    job = self._next()
+                if job:
+                    threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+
+def report_time(path):
+    from datetime import datetime
+    match = REPORT_NAME.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+
+
+class ReportIndex:
+    # Summary of every saved report in ``directory`` (time from the file name,
+    # cups, add-ons and sales), kept in a JSON file next to the reports. It is
+    # built by one scan the first time and then updated by ``add`` on each save,
+    # so listing history never re-reads the reports themselves.
+    def __init__(self, directory, store):
+        self.directory = directory
+        self.store = store
+        self.path = os.path.join(directory, INDEX_NAME)
+        self.entries = {}
+        self.version = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def open(self):
+        # Runs on a worker thread, so entries ``add`` made in the meantime are kept
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            entries = None
+        if not isinstance(entries, dict):
+            self.rescan()
+            return
+        with self._lock:
+            for name, entry in entries.items():
+                self.entries.setdefault(name, entry)
+            self.version += 1
+
+    def rescan(self):
+        # Only files missing from the index are parsed; deleted ones are dropped.
+        # Saves indexed by ``add`` while the scan runs are kept as they are.
+        import csv
+        import glob
+        # Taken before listing the directory: a name added after this is never dropped
+        with self._lock:
+            known = set(self.entries)
+        names = {os.path.basename(p) for p in glob.glob(os.path.join(self.directory, "cups_report_*.csv"))}
+        found = {}
+        for name in names - known:
+            if report_time(name) is None:
+                continue
+            try:
+                counts, _ = read_report(os.path.join(self.directory, name), self.store)
+            except (OSError, UnicodeDecodeError, csv.Error, ReportError):
+                continue
+            found[name] = self._entry(name, counts)
+        with self._lock:
+            for name in known - names:
+                self.entries.pop(name, None)
+            for name, entry in found.items():
+                self.entries.setdefault(name, entry)
+            self.version += 1
+        self._write()
+
+    def _entry(self, name, counts):
+        cups, addons, sales = self.store.totals_of(counts)
+        return {"saved_at": report_time(name).strftime("%Y-%m-%d %H:%M:%S"), "cups": cups, "addons": addons,
+                "sales": sales}
+
+    def add(self, path, counts):
+        name = os.path.basename(path)
+        if report_time(name) is None:
+            return
+        with self._lock:
+            self.entries[name] = self._entry(name, counts)
+            self.version += 1
+        self._write()
+
+    def _write(self):
+        with self._write_lock:
+            with self._lock:
+                data = json.dumps(self.entries)
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w") as file:
+                    file.write(data)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+    def newest_first(self):
+        with self._lock:
+            return sorted(self.entries.items(), key=lambda item: item[1]["saved_at"], reverse=True)
@@ -0,0 +1,200 @@
+import os
+import struct
+import time
+from array import array
+
+from journal import catalog_signature, move_aside, pack_keys, remap, slot_map, unpack_keys
+
+
+SHIFTS_NAME = "shifts.bin"
+
+# File: magic, catalog signature, the time the first shift started and the slot
+# keys (see journal.py), then one record per handover: time, cashier name
+# length, the name, and the counts of every slot at that moment
+HEADER = struct.Struct("<4sId")
+MAGIC = b"CUPH"
+RECORD = struct.Struct("<dH")
+
+# Figures of the cashier performance text, in order
+FIGURES = ("cups", "AO", "SD", "BV", "BROWNIE", "CRAZY")
+
+
+class Figures:
+    # Reads the cashier performance figures off a store's running totals
+    # (constant time) or off any counts array laid out like it
+    def __init__(self, store):
+        self.store = store
+        self.categories = [store.category_index(name) for name in ("Special Drinks", "Secret Menu")]
+        self.slots = [store.slot("Secret Menu", product, "fixed") for product in ("BROWNIE", "CRAZY")]
+
+    def current(self):
+        store = self.store
+        values = [store.drink_cups, store.addons_cups]
+        values += [0 if ci is None else store.category_totals(ci)[0] for ci in self.categories]
+        values += [0 if slot is None else store.counts[slot] for slot in self.slots]
+        return tuple(values)
+
+    def of(self, counts):
+        store = self.store
+        drinks, addons, _ = store.totals_of(counts)
+        values = [drinks, addons]
+        for ci in self.categories:
+            if ci is None:
+                values.append(0)
+            else:
+                start, end = store.cat_ranges[ci]
+                values.append(sum(counts[start:end]))
+        values += [0 if slot is None else counts[slot] for slot in self.slots]
+        return tuple(values)
+
+
+class Snapshot:
+    __slots__ = ("time", "cashier", "counts", "figures")
+
+    def __init__(self, when, cashier, counts, figures):
+        self.time = when
+        self.cashier = cashier
+        self.counts = counts
+        self.figures = figures
+
+
+class Shift:
+    __slots__ = ("cashier", "started", "ended", "figures")
+
+    def __init__(self, cashier, started, ended, figures):
+        self.cashier = cashier
+        self.started = started
+        self.ended = ended
+        self.figures = figures
+
+
+def diff(later, earlier):
+    return tuple(a - b for a, b in zip(later, earlier))
+
+
+class ShiftLog:
+    # Snapshots of all counts taken at each cashier handover. A shift's figures
+    # are the difference between the figures stored with two snapshots, so no
+    # rows are rescanned; the first shift starts from zero.
+    def __init__(self, path, store):
+        self.path = path
+        self.store = store
+        self.signature = catalog_signature(store)
+        self.keys = pack_keys(store)
+        self.figures = Figures(store)
+        self.snapshots = []
+        self.started = time.time()
+
+    def open(self):
+        try:
+            with open(self.path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return
+        keys = None
+        if len(data) >= HEADER.size:
+            magic, signature, started = HEADER.unpack_from(data)
+            if magic == MAGIC:
+                keys, offset = unpack_keys(data, HEADER.size)
+        if keys is None:
+            move_aside(self.path)
+            return
+        self.started = started
+        mapping = None if signature == self.signature else slot_map(self.store, keys)
+        counts_size = len(keys) * self.store.counts.itemsize
+        while offset + RECORD.size <= len(data):
+            when, name_size = RECORD.unpack_from(data, offset)
+            start = offset + RECORD.size + name_size
+            if start + counts_size > len(data):
+                # Torn by a crash mid-write
+                break
+            cashier = data[offset + RECORD.size:start].decode("utf-8", "replace")
+            counts = array("l", data[start:start + counts_size])
+            if mapping is not None:
+                counts = remap(counts, mapping, len(self.store))
+            self.snapshots.append(Snapshot(when, cashier, counts, self.figures.of(counts)))
+            offset = start + counts_size
+        if mapping is not None:
+            # Written under an earlier catalog: keep that file and carry on in the current layout
+            move_aside(self.path)
+            self._write(self.snapshots)
+        elif offset != len(data):
+            # Drop a torn handover so the next one is appended in line
+            with open(self.path, "r+b") as file:
+                file.truncate(offset)
+
+    def _write(self, snapshots, append=False):
+        data = bytearray()
+        if not append:
+            data += HEADER.pack(MAGIC, self.signature, self.started) + self.keys
+        for snapshot in snapshots:
+            name = snapshot.cashier.encode("utf-8")[:0xFFFF]
+            data += RECORD.pack(snapshot.time, len(name)) + name + snapshot.counts.tobytes()
+        with open(self.path, "ab" if append else "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def handover(self, cashier, when=None):
+        # Closes the current shift under ``cashier`` and returns it
+        snapshot = Snapshot(time.time() if when is None else when, cashier, self.store.snapshot(),
+                            self.figures.current())
+        self._write([snapshot], append=bool(self.snapshots))
+        self.snapshots.append(snapshot)
+        return self.shifts()[-1]
+
+    def counts_of(self, index):
+        # What closed shift ``index`` added to every slot
+        index %= len(self.snapshots)
+        counts = self.snapshots[index].counts
+        if index == 0:
+            return counts[:]
+        previous = self.snapshots[index - 1].counts
+        return array("l", (a - b for a, b in zip(counts, previous)))
+
+    def clear(self):
+        # For when the counts are replaced wholesale and the snapshots no longer apply
+        self.snapshots = []
+        self.started = time.time()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def current(self, cashier=""):
+        # The shift still running since the last handover
+        if self.snapshots:
+            last = self.snapshots[-1]
+            return Shift(cashier, last.time, None, diff(self.figures.current(), last.figures))
+        return Shift(cashier, self.started, None, self.figures.current())
+
+    def shifts(self):
+        # Every closed shift, oldest first
+        shifts = []
+        previous = None
+        for snapshot in self.snapshots:
+            if previous is None:
+                shifts.append(Shift(snapshot.cashier, self.started, snapshot.time, snapshot.figures))
+            else:
+                shifts.append(Shift(snapshot.cashier, previous.time, snapshot.time,
+                                    diff(snapshot.figures, previous.figures)))
+            previous = snapshot
+        return shifts
+
+
+def performance_text(date, shifts, branch="San Vicente"):
+    # Clipboard text for one or more shifts, under one header
+    blocks = ["CASHIER PERFORMANCE\n"
+              f"DATE: {date}"]
+    for shift in shifts:
+        cups, ao, sd, bv, brownie, crazy = shift.figures
+        blocks.append(
+            f"🟤 {branch} ({cups})\n"
+            f"CASHIER: {shift.cashier}\n"
+            f"AO: {ao}\n"
+            f"SD: {sd}\n"
+            f"BV: {bv}\n\n"
+            f"BROWNIE: {brownie}\n"
+            f"CRAZY : {crazy}"
+        )
+    return "\n\n".join(blocks)
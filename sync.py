@@ -0,0 +1,332 @@
+"""Live count sharing between the terminals at one counter.
+
+Every terminal keeps its own net count per slot and the latest own counts it
+has heard from each peer; the count shown is the sum over all terminals.
+Updates carry absolute values and the sender's sequence number, so packets
+that arrive late, twice or out of order never throw the totals off, and every
+terminal converges on the same counts.
+
+Changed slots are broadcast in small UDP batches; a full resend every few
+seconds covers lost packets and terminals that join late.
+
+    python sync.py --port 47811 --app 127.0.0.1:47810 --taps 200
+
+runs a stand-in terminal on this machine for testing. Start the app with
+CUPS_SYNC=1 CUPS_SYNC_PEERS=127.0.0.1:47811 to pair it with the stand-in.
+"""
+import argparse
+import os
+import random
+import socket
+import struct
+import threading
+import time
+from array import array
+
+from journal import catalog_signature, move_aside, pack_keys, remap, slot_map, unpack_keys
+
+
+SYNC_PORT = 47810
+STATE_NAME = "sync.state"
+
+# Packet: magic, catalog signature, device id, sequence number, record count,
+# followed by (slot, absolute own count) records
+PACKET = struct.Struct("<4sIQIH")
+PACKET_MAGIC = b"CUPY"
+RECORD = struct.Struct("<Hi")
+MAX_RECORDS = 200
+
+# State file: magic, catalog signature, device id, sequence number, peer count,
+# the slot keys (see journal.py), own counts, then per peer its device id,
+# counts and per-slot sequence numbers
+STATE = struct.Struct("<4sIQII")
+STATE_MAGIC = b"CUPX"
+DEVICE = struct.Struct("<Q")
+# Added to the saved sequence number on restore: packets sent after the last
+# save but before a crash must not outrank the ones sent after the restart
+SEQ_GAP = 1 << 16
+
+
+def zeros(typecode, size):
+    return array(typecode, bytes(size * array(typecode).itemsize))
+
+
+def remap_seqs(seqs, mapping, size):
+    # Like journal.remap, but slots merged by a rename keep the highest sequence number
+    moved = zeros("L", size)
+    for old, seq in enumerate(seqs):
+        if mapping[old] is not None:
+            moved[mapping[old]] = max(moved[mapping[old]], seq)
+    return moved
+
+
+def parse_peers(text):
+    # "host:port,host:port" -> [(host, port), ...]
+    peers = []
+    for item in text.split(","):
+        host, _, port = item.strip().rpartition(":")
+        if host:
+            peers.append((host, int(port)))
+    return peers
+
+
+class Peer:
+    __slots__ = ("counts", "seqs")
+
+    def __init__(self, size):
+        self.counts = zeros("l", size)
+        self.seqs = zeros("L", size)
+
+
+class CountSync:
+    # Not thread-safe: the app only touches it from the UI thread
+    def __init__(self, store, device_id=None):
+        self.store = store
+        self.signature = catalog_signature(store)
+        self.device_id = device_id or random.getrandbits(63) + 1
+        self.seq = 0
+        size = len(store)
+        self.own = zeros("l", size)
+        self.sent = zeros("B", size)
+        self.peer_sum = zeros("l", size)
+        self.peers = {}
+        # Bumped on every change, so callers can tell when the state needs saving
+        self.version = 0
+        self._dirty = set()
+
+    def adopt(self):
+        # Used when sync is first switched on: everything counted so far was counted here
+        for slot, count in enumerate(self.store.counts):
+            if count:
+                self.record(slot, count)
+
+    def record(self, slot, delta):
+        # Called after ``delta`` was applied to the store. Returns a further delta
+        # already applied to bring the slot back to the shared count, which only
+        # differs when the terminals together took more off than was counted.
+        self.own[slot] += delta
+        self.version += 1
+        self._dirty.add(slot)
+        if not self.peer_sum[slot]:
+            return 0
+        store = self.store
+        return store.apply(slot, max(0, self.own[slot] + self.peer_sum[slot]) - store.counts[slot])
+
+    def record_changes(self, before, after):
+        # After the counts were replaced or merged in one go, e.g. by loading a report
+        for slot, (old, new) in enumerate(zip(before, after)):
+            if old != new:
+                self.record(slot, new - old)
+
+    def shared_counts(self):
+        return array("l", (max(0, own + peers) for own, peers in zip(self.own, self.peer_sum)))
+
+    def packets(self, full=False):
+        # Pending changes (or every slot ever sent, when ``full``) as ready-to-send packets
+        if full:
+            slots = [slot for slot in range(len(self.own)) if self.sent[slot] or self.own[slot]]
+        else:
+            slots = sorted(self._dirty)
+        if not slots:
+            return []
+        if self._dirty or self.seq == 0:
+            # Without new changes a full resend repeats values already sent, so it keeps the number
+            self.seq += 1
+        self._dirty.clear()
+        records = [(slot, self.own[slot]) for slot in slots]
+        packets = []
+        for start in range(0, len(records), MAX_RECORDS):
+            batch = records[start:start + MAX_RECORDS]
+            data = bytearray(PACKET.pack(PACKET_MAGIC, self.signature, self.device_id, self.seq, len(batch)))
+            for slot, count in batch:
+                data += RECORD.pack(slot, count)
+                self.sent[slot] = 1
+            packets.append(bytes(data))
+        return packets
+
+    def receive(self, data):
+        # Applies a peer's packet to the store; returns [(slot, applied delta), ...]
+        if len(data) < PACKET.size:
+            return []
+        magic, signature, device_id, seq, count = PACKET.unpack_from(data)
+        if (magic != PACKET_MAGIC or signature != self.signature or device_id == self.device_id
+                or len(data) != PACKET.size + count * RECORD.size):
+            return []
+        size = len(self.own)
+        peer = self.peers.get(device_id)
+        if peer is None:
+            peer = self.peers[device_id] = Peer(size)
+        changed = []
+        for slot, value in RECORD.iter_unpack(data[PACKET.size:]):
+            if slot >= size or seq <= peer.seqs[slot]:
+                continue
+            peer.seqs[slot] = seq
+            delta = value - peer.counts[slot]
+            if delta:
+                peer.counts[slot] = value
+                self.peer_sum[slot] += delta
+                changed.append(slot)
+        self.version += 1
+        applied = []
+        store = self.store
+        for slot in changed:
+            target = max(0, self.own[slot] + self.peer_sum[slot])
+            delta = store.apply(slot, target - store.counts[slot])
+            if delta:
+                applied.append((slot, delta))
+        return applied
+
+    def save(self, path):
+        data = bytearray(STATE.pack(STATE_MAGIC, self.signature, self.device_id, self.seq, len(self.peers)))
+        data += pack_keys(self.store)
+        data += self.own.tobytes()
+        for device_id, peer in self.peers.items():
+            data += DEVICE.pack(device_id)
+            data += peer.counts.tobytes()
+            data += peer.seqs.tobytes()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        # Returns False, leaving everything untouched, when there is no usable
+        # state. State saved under an earlier catalog is moved to the current slots.
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return False
+        keys = None
+        if len(data) >= STATE.size:
+            magic, signature, device_id, seq, peer_count = STATE.unpack_from(data)
+            if magic == STATE_MAGIC:
+                keys, offset = unpack_keys(data, STATE.size)
+        if keys is not None:
+            counts_size = len(keys) * self.own.itemsize
+            seqs_size = len(keys) * array("L").itemsize
+        if keys is None or len(data) != offset + counts_size + peer_count * (DEVICE.size + counts_size + seqs_size):
+            move_aside(path)
+            return False
+        size = len(self.own)
+        mapping = None if signature == self.signature else slot_map(self.store, keys)
+        self.device_id = device_id
+        self.seq = seq + SEQ_GAP
+        self.own = array("l", data[offset:offset + counts_size])
+        offset += counts_size
+        self.peer_sum = zeros("l", size)
+        self.peers = {}
+        for _ in range(peer_count):
+            (peer_id,) = DEVICE.unpack_from(data, offset)
+            offset += DEVICE.size
+            peer = self.peers[peer_id] = Peer(size)
+            peer.counts = array("l", data[offset:offset + counts_size])
+            offset += counts_size
+            peer.seqs = array("L", data[offset:offset + seqs_size])
+            offset += seqs_size
+            if mapping is not None:
+                peer.counts = remap(peer.counts, mapping, size)
+                peer.seqs = remap_seqs(peer.seqs, mapping, size)
+            for slot, count in enumerate(peer.counts):
+                self.peer_sum[slot] += count
+        if mapping is not None:
+            self.own = remap(self.own, mapping, size)
+        for slot, count in enumerate(self.own):
+            self.sent[slot] = 1 if count else 0
+        return True
+
+
+class UdpTransport:
+    # Sends to the listed peers, or broadcasts on ``port`` when there are none.
+    # Received packets are handed to ``on_packet`` on a background thread.
+    def __init__(self, on_packet, port=SYNC_PORT, peers=None):
+        self.on_packet = on_packet
+        self.targets = list(peers) if peers else [("<broadcast>", port)]
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.bind(("", port))
+        self.sock.settimeout(0.5)
+        self._closed = False
+        self._thread = threading.Thread(target=self._listen, daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        while not self._closed:
+            try:
+                data, _ = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.on_packet(data)
+
+    def send(self, packets):
+        for data in packets:
+            for target in self.targets:
+                try:
+                    self.sock.sendto(data, target)
+                except OSError:
+                    # Wi-Fi dropped or the peer is not up yet; the next full resend catches up
+                    pass
+
+    def close(self):
+        self._closed = True
+        self._thread.join()
+        self.sock.close()
+
+
+def main(argv=None):
+    from catalog import load_catalog
+    from model import CountStore
+
+    parser = argparse.ArgumentParser(description="Run a stand-in sync terminal that taps at random.")
+    parser.add_argument("--port", type=int, default=SYNC_PORT + 1, help="port this stand-in listens on")
+    parser.add_argument("--app", default=f"127.0.0.1:{SYNC_PORT}", help="host:port of the terminal(s) to sync with")
+    parser.add_argument("--taps", type=int, default=100, help="random taps to make, then just listen")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between taps")
+    parser.add_argument("--linger", type=float, default=5, help="seconds to keep syncing after the last tap")
+    parser.add_argument("--catalog", help="catalog file (default: the bundled catalog.json)")
+    args = parser.parse_args(argv)
+
+    catalog = load_catalog(args.catalog)
+    store = CountStore(catalog.categories, catalog.aliases)
+    sync = CountSync(store)
+    lock = threading.Lock()
+
+    def on_packet(data):
+        with lock:
+            sync.receive(data)
+
+    transport = UdpTransport(on_packet, args.port, parse_peers(args.app))
+    rng = random.Random()
+    last_full = time.monotonic()
+    end = None
+    taps = 0
+    try:
+        while end is None or time.monotonic() < end:
+            with lock:
+                if taps < args.taps:
+                    slot = rng.randrange(len(store))
+                    delta = store.apply(slot, 1 if rng.random() < 0.85 else -1)
+                    if delta:
+                        sync.record(slot, delta)
+                    taps += 1
+                elif end is None:
+                    end = time.monotonic() + args.linger
+                full = time.monotonic() - last_full > 2
+                packets = sync.packets(full=full)
+            if full:
+                last_full = time.monotonic()
+            transport.send(packets)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transport.close()
+    print(f"own cups {sum(sync.own)}  shared drinks {store.drink_cups}  add-ons {store.addons_cups}  "
+          f"sales ₱{store.sales}  peers {len(sync.peers)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# The app's modules sit next to main.py rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model import CategorySpec, CountStore  # noqa: E402
+
+
+def small_catalog():
+    return [
+        CategorySpec("Add Ons", ["P", "ES"], kind="addons", fixed_prices={"P": 9, "ES": 15}),
+        CategorySpec("Praf", ["PCA", "PV"], price_medio=49, price_grande=59),
+        CategorySpec("Hot Brew", ["HB"], kind="single", fixed_prices={"HB": 39}),
+    ]
+
+
+@pytest.fixture
+def store():
+    return CountStore(small_catalog())
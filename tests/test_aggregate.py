@@ -0,0 +1,40 @@
+from aggregate import ReportCache, load_reports
+from history import HistoryStore
+from reports import write_report
+
+
+def saved_reports(tmp_path, store):
+    store.load([0, 0, 2, 1, 0, 0, 3])
+    good = str(tmp_path / "cups_report_20261017_200000.csv")
+    write_report(good, store, store.counts)
+    bad = tmp_path / "cups_report_20261018_200000.csv"
+    bad.write_bytes(b"Category,Product\n\xff\xfe\x00bad\n")
+    return good, str(bad)
+
+
+def test_unreadable_reports_are_skipped_not_fatal(tmp_path, store):
+    good, bad = saved_reports(tmp_path, store)
+    cache = ReportCache(str(tmp_path / "cache.json"))
+    reports, skipped = load_reports([good, bad], cache)
+    assert list(reports) == [good] and skipped == [bad]
+    assert cache.get(bad) is None
+
+    reports, skipped = load_reports([good, bad], cache, jobs=2)
+    assert list(reports) == [good] and skipped == [bad]
+
+
+def test_csv_without_report_columns_is_skipped(tmp_path, store):
+    notes = tmp_path / "cups_report_20261018_200000.csv"
+    notes.write_text("Name,Count\nAna,3\n")
+    cache = ReportCache(str(tmp_path / "cache.json"))
+    assert load_reports([str(notes)], cache) == ({}, [str(notes)])
+    assert cache.get(str(notes)) is None
+
+
+def test_history_import_skips_unreadable_reports(tmp_path, store):
+    good, bad = saved_reports(tmp_path, store)
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    imported, skipped = history.import_reports([good, bad], store, batch_size=1)
+    assert (imported, skipped) == (1, [bad])
+    with history.connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM reports").fetchone()[0] == 1
@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+from catalog import CatalogError, compile_catalog, from_compiled, load_catalog
+from model import CountStore
+
+
+def catalog_data(**praf):
+    entry = {"name": "Praf", "kind": "size", "medio": 49, "grande": 59, "products": ["PCA", "PISTACIO"]}
+    entry.update(praf)
+    return {"version": 2, "categories": [
+        entry,
+        {"name": "Hot Brew", "kind": "single", "prices": {"HB": 39, "HF": 41}},
+        {"name": "Add Ons", "kind": "addons", "prices": {"P": 9, "ES": 15}},
+    ]}
+
+
+def test_compiles_categories_in_file_order():
+    catalog = from_compiled(compile_catalog(catalog_data()))
+    assert catalog.version == 2
+    assert [spec.name for spec in catalog.categories] == ["Praf", "Hot Brew", "Add Ons"]
+    praf, hot_brew, _ = catalog.categories
+    assert (praf.price_medio, praf.price_grande, praf.products) == (49, 59, ["PCA", "PISTACIO"])
+    assert hot_brew.fixed_prices == {"HB": 39, "HF": 41}
+    assert catalog.aliases == {}
+
+
+def test_old_names_resolve_to_current_ones():
+    catalog = from_compiled(compile_catalog(catalog_data(formerly=["Frappe"], renamed={"PISTACHIO": "PISTACIO"})))
+    assert catalog.resolve("Praf", "PISTACHIO") == ("Praf", "PISTACIO")
+    assert catalog.resolve("Frappe", "PCA") == ("Praf", "PCA")
+    assert catalog.resolve("Frappe", "PISTACHIO") == ("Praf", "PISTACIO")
+    assert catalog.resolve("Hot Brew", "HB") == ("Hot Brew", "HB")
+    store = CountStore(catalog.categories, catalog.aliases)
+    assert store.lookup("Frappe", "PISTACHIO") == store.lookup("Praf", "PISTACIO")
+
+
+@pytest.mark.parametrize("change, message", [
+    ({"medio": 49.5}, "whole number"),
+    ({"products": []}, "no products"),
+    ({"products": ["PCA", "PCA"]}, "unique"),
+    ({"kind": "bundle"}, "kind must be"),
+    ({"renamed": {"OLD": "MISSING"}}, "unknown product"),
+    ({"renamed": {"PCA": "PISTACIO"}}, "already in use"),
+    ({"formerly": [["Frappe"]]}, "list of names"),
+    ({"formerly": "Frappe"}, "list of names"),
+    ({"renamed": {"OLD": ["PCA"]}}, "object of product names"),
+])
+def test_invalid_catalogs_are_rejected(change, message):
+    with pytest.raises(CatalogError, match=message):
+        compile_catalog(catalog_data(**change))
+
+
+def test_duplicate_category_is_rejected():
+    data = catalog_data()
+    data["categories"].append(dict(data["categories"][1]))
+    with pytest.raises(CatalogError, match="duplicate"):
+        compile_catalog(data)
+
+
+def test_load_uses_the_cache_until_the_file_changes(tmp_path):
+    path = str(tmp_path / "catalog.json")
+    cache_path = str(tmp_path / "catalog.cache.json")
+    with open(path, "w") as file:
+        json.dump(catalog_data(), file)
+    first = load_catalog(path, cache_path)
+    assert os.path.exists(cache_path)
+    assert load_catalog(path, cache_path) is first
+
+    data = catalog_data()
+    data["categories"][1]["prices"]["HB"] = 45
+    with open(path, "w") as file:
+        json.dump(data, file)
+    os.utime(path, ns=(1, 1))
+    second = load_catalog(path, cache_path)
+    assert second.categories[1].fixed_prices["HB"] == 45
+
+
+def test_missing_and_broken_files_raise_catalog_error(tmp_path):
+    with pytest.raises(CatalogError):
+        load_catalog(str(tmp_path / "missing.json"))
+    path = tmp_path / "broken.json"
+    path.write_text("{not json")
+    with pytest.raises(CatalogError, match="not valid JSON"):
+        load_catalog(str(path))
+
+
+def test_bundled_catalog_compiles():
+    catalog = load_catalog()
+    assert catalog.categories
+    assert len(CountStore(catalog.categories, catalog.aliases)) > 0
+
+
+def test_damaged_cache_is_rebuilt(tmp_path, monkeypatch):
+    import catalog
+
+    path = str(tmp_path / "catalog.json")
+    cache_path = str(tmp_path / "catalog.cache.json")
+    with open(path, "w") as file:
+        json.dump(catalog_data(), file)
+    load_catalog(path, cache_path)
+    with open(cache_path) as file:
+        cached = json.load(file)
+    cached["catalog"] = {"version": 2, "categories": [["Praf"]], "aliases": []}
+    for damaged in ([1, 2], cached):
+        with open(cache_path, "w") as file:
+            json.dump(damaged, file)
+        monkeypatch.setattr(catalog, "_loaded", {})
+        assert [spec.name for spec in load_catalog(path, cache_path).categories] == ["Praf", "Hot Brew", "Add Ons"]
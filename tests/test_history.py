@@ -0,0 +1,60 @@
+import os
+from datetime import datetime
+
+from history import HistoryStore, branch_name, csv_lines
+from model import CategorySpec, CountStore
+from reports import write_report
+from shifts import ShiftLog
+
+
+def test_app_saves_and_imports_share_a_branch(tmp_path, store):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.load([0, 0, 2, 1, 0, 0, 3])
+    path = str(tmp_path / "cups_report_20261018_200000.csv")
+    write_report(path, store, store.counts)
+    history.add_counts(path, datetime(2026, 10, 18, 20), store, store.counts)
+    history.import_reports([path], store)
+    with history.connect() as conn:
+        assert conn.execute("SELECT branch FROM reports").fetchall() == [(branch_name(str(tmp_path)),)]
+    assert history.range_totals("2026-10-18", "2026-10-18") == (6, 2 * 49 + 59 + 3 * 39)
+
+
+def test_cashier_figures_come_from_shift_deltas(tmp_path, store):
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    log = ShiftLog(str(tmp_path / "shifts.bin"), store)
+    started = datetime(2026, 10, 18, 8).timestamp()
+    store.apply(2, 3)
+    log.handover("Ana", when=started + 3600)
+    store.apply(2, 1)
+    store.apply(6, 2)
+    log.handover("Ben", when=started + 7200)
+    store.apply(6, 1)
+    log.handover("Ana", when=started + 10800)
+    for i, shift in enumerate(log.shifts()):
+        history.add_shift("branch", shift.cashier, shift.started, shift.ended, store, log.counts_of(i))
+    # Saving the running tally must not count towards any cashier
+    history.add_counts(os.path.join(str(tmp_path), "cups_report.csv"), datetime(2026, 10, 18, 21), store,
+                       store.counts)
+
+    assert list(log.counts_of(1)) == [0, 0, 1, 0, 0, 0, 2]
+    assert history.range_totals("2026-10-18", "2026-10-18", cashier="Ana") == (4, 3 * 49 + 39)
+    assert history.range_totals("2026-10-18", "2026-10-18", cashier="Ben") == (3, 49 + 2 * 39)
+    assert history.top_products("2026-10-18", "2026-10-18", cashier="Ben") == [("Hot Brew", "HB", 2, 78),
+                                                                                ("Praf", "PCA", 1, 49)]
+
+
+def test_imports_keep_the_sales_saved_in_the_report(tmp_path, store):
+    store.load([0, 0, 2, 1, 0, 0, 3])
+    path = str(tmp_path / "cups_report_20261018_200000.csv")
+    write_report(path, store, store.counts)
+    # Prices went up after the report was saved
+    repriced = CountStore([
+        CategorySpec("Add Ons", ["P", "ES"], kind="addons", fixed_prices={"P": 10, "ES": 20}),
+        CategorySpec("Praf", ["PCA", "PV"], price_medio=98, price_grande=118),
+        CategorySpec("Hot Brew", ["HB"], kind="single", fixed_prices={"HB": 45}),
+    ])
+    assert csv_lines(path, repriced) == [("Praf", "PCA", "medio", 2, 98), ("Praf", "PCA", "grande", 1, 59),
+                                         ("Hot Brew", "HB", "fixed", 3, 117)]
+    history = HistoryStore(str(tmp_path / "history.sqlite3"))
+    history.import_reports([path], repriced)
+    assert history.range_totals("2026-10-18", "2026-10-18") == (6, 2 * 49 + 59 + 3 * 39)
@@ -0,0 +1,158 @@
+import os
+
+from journal import HEADER, JOURNAL_NAME, RECORD, Journal
+from model import CategorySpec, CountStore
+
+from conftest import small_catalog
+
+
+def reopen(directory, **kwargs):
+    store = CountStore(small_catalog())
+    journal = Journal(directory, store, **kwargs)
+    replayed = journal.open()
+    return store, journal, replayed
+
+
+def test_taps_survive_a_restart(tmp_path):
+    store, journal, _ = reopen(str(tmp_path))
+    for slot, delta in [(2, 1), (2, 1), (6, 3), (2, -1)]:
+        journal.record(slot, store.apply(slot, delta))
+    journal.close()
+
+    restored, journal, replayed = reopen(str(tmp_path))
+    assert replayed == 4
+    assert list(restored.counts) == list(store.counts)
+    assert restored.sales == store.sales
+    journal.close()
+
+
+def test_unflushed_taps_are_lost_but_flushed_ones_are_not(tmp_path):
+    store, journal, _ = reopen(str(tmp_path), flush_every=2)
+    journal.record(0, store.apply(0, 1))
+    journal.record(0, store.apply(0, 1))
+    journal.record(0, store.apply(0, 1))
+    # Simulated kill: the third record is still in memory
+    journal._file.close()
+    journal._file = None
+
+    restored, journal, _ = reopen(str(tmp_path))
+    assert restored.counts[0] == 2
+    journal.close()
+
+
+def test_compaction_folds_the_journal_into_a_snapshot(tmp_path):
+    store, journal, _ = reopen(str(tmp_path), flush_every=1, compact_every=10)
+    for _ in range(25):
+        journal.record(6, store.apply(6, 1))
+    assert journal.records == 5
+    journal.close()
+    size = os.path.getsize(os.path.join(str(tmp_path), JOURNAL_NAME))
+    assert size == HEADER.size + 5 * RECORD.size
+
+    restored, journal, replayed = reopen(str(tmp_path))
+    assert replayed == 5
+    assert restored.counts[6] == 25
+    journal.close()
+
+
+def test_torn_record_is_dropped(tmp_path):
+    store, journal, _ = reopen(str(tmp_path))
+    journal.record(2, store.apply(2, 4))
+    journal.close()
+    with open(os.path.join(str(tmp_path), JOURNAL_NAME), "ab") as file:
+        file.write(b"\x01\x02\x03")
+
+    restored, journal, replayed = reopen(str(tmp_path))
+    assert replayed == 1
+    journal.record(3, restored.apply(3, 1))
+    journal.close()
+    restored, journal, _ = reopen(str(tmp_path))
+    assert restored.counts[2] == 4 and restored.counts[3] == 1
+    journal.close()
+
+
+def test_leftover_journal_of_an_older_generation_is_not_replayed(tmp_path):
+    # A crash between writing the snapshot and resetting the journal
+    store, journal, _ = reopen(str(tmp_path))
+    journal.record(6, store.apply(6, 2))
+    journal.flush()
+    path = os.path.join(str(tmp_path), JOURNAL_NAME)
+    with open(path, "rb") as file:
+        stale = file.read()
+    journal.compact()
+    journal.close()
+    with open(path, "wb") as file:
+        file.write(stale)
+
+    restored, journal, _ = reopen(str(tmp_path))
+    assert restored.counts[6] == 2
+    journal.close()
+
+
+def changed_catalog():
+    # PV renamed to PISTACIO, HB dropped, a new Praf product and category added
+    return [
+        CategorySpec("Add Ons", ["P", "ES"], kind="addons", fixed_prices={"P": 9, "ES": 15}),
+        CategorySpec("Iced Coffee", ["BIC"], price_medio=29, price_grande=39),
+        CategorySpec("Praf", ["PCA", "PISTACIO", "NEW"], price_medio=49, price_grande=59),
+    ]
+
+
+def test_counts_follow_the_catalog_when_it_changes(tmp_path):
+    store, journal, _ = reopen(str(tmp_path), flush_every=1, compact_every=4)
+    for slot, delta in [(0, 2), (3, 4), (5, 1), (6, 7), (2, 1)]:
+        journal.record(slot, store.apply(slot, delta))
+    journal.close()
+
+    new_store = CountStore(changed_catalog(), aliases={("Praf", "PV"): ("Praf", "PISTACIO")})
+    journal = Journal(str(tmp_path), new_store)
+    journal.open()
+    assert new_store.counts[new_store.slot("Add Ons", "P", "fixed")] == 2
+    assert new_store.counts[new_store.slot("Praf", "PCA", "medio")] == 1
+    assert new_store.counts[new_store.slot("Praf", "PCA", "grande")] == 4
+    assert new_store.counts[new_store.slot("Praf", "PISTACIO", "grande")] == 1
+    assert new_store.drink_cups == 6
+    journal.record(0, new_store.apply(0, 1))
+    journal.close()
+    # The files of the old layout are kept next to the new ones
+    assert len([name for name in os.listdir(str(tmp_path)) if name.startswith("counts.snap.")]) == 1
+
+    reopened = CountStore(changed_catalog())
+    journal = Journal(str(tmp_path), reopened)
+    journal.open()
+    assert list(reopened.counts) == list(new_store.counts)
+    journal.close()
+
+
+def test_unusable_journal_is_moved_aside(tmp_path):
+    store, journal, _ = reopen(str(tmp_path))
+    journal.record(6, store.apply(6, 3))
+    journal.close()
+    path = os.path.join(str(tmp_path), JOURNAL_NAME)
+    with open(path, "r+b") as file:
+        file.write(b"XXXX")
+
+    restored, journal, replayed = reopen(str(tmp_path))
+    assert replayed == 0 and restored.counts[6] == 0
+    journal.close()
+    aside = [name for name in os.listdir(str(tmp_path)) if name.startswith(JOURNAL_NAME + ".")]
+    assert len(aside) == 1
+    with open(os.path.join(str(tmp_path), aside[0]), "rb") as file:
+        assert file.read()[HEADER.size:] == RECORD.pack(6, 3)
+
+
+def test_the_tally_keeps_its_business_day(tmp_path):
+    store, journal, _ = reopen(str(tmp_path))
+    journal.start_day(20261017)
+    journal.record(6, store.apply(6, 2))
+    journal.close()
+
+    restored, journal, _ = reopen(str(tmp_path))
+    assert journal.day == 20261017 and restored.counts[6] == 2
+    restored.reset()
+    journal.start_day(20261018)
+    journal.close()
+
+    restored, journal, _ = reopen(str(tmp_path))
+    assert journal.day == 20261018 and not any(restored.counts)
+    journal.close()
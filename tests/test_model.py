@@ -0,0 +1,83 @@
+from array import array
+
+from model import CountStore
+
+from conftest import small_catalog
+
+
+def test_slots_are_laid_out_category_by_category(store):
+    assert len(store) == 7
+    assert store.slot("Add Ons", "P", "fixed") == 0
+    assert store.slot("Praf", "PCA", "medio") == 2
+    assert store.slot("Praf", "PCA", "grande") == 3
+    assert store.slot("Hot Brew", "HB", "fixed") == 6
+    assert store.slot("Praf", "PCA", "fixed") is None
+    assert store.cat_ranges == [(0, 2), (2, 6), (6, 7)]
+
+
+def test_apply_keeps_running_totals(store):
+    store.apply(store.slot("Praf", "PCA", "medio"), 2)
+    store.apply(store.slot("Praf", "PV", "grande"), 1)
+    store.apply(store.slot("Hot Brew", "HB", "fixed"), 3)
+    store.apply(store.slot("Add Ons", "ES", "fixed"), 1)
+    assert store.drink_cups == 6
+    assert store.addons_cups == 1
+    assert store.addons_sales == 15
+    assert store.sales == 2 * 49 + 59 + 3 * 39 + 15
+    assert store.category_totals(1) == (3, 2 * 49 + 59)
+    # Add-ons split AO and ES into the category's two buckets
+    assert store.bucket_totals(0) == (0, 0)
+    assert store.bucket_totals(1) == (1, 15)
+
+
+def test_apply_never_goes_below_zero(store):
+    slot = store.slot("Hot Brew", "HB", "fixed")
+    assert store.apply(slot, 2) == 2
+    assert store.apply(slot, -5) == -2
+    assert store.counts[slot] == 0
+    assert store.apply(slot, -1) == 0
+    assert store.drink_cups == 0 and store.sales == 0
+
+
+def test_totals_match_a_full_recompute(store):
+    deltas = [(0, 3), (2, 5), (3, 1), (6, 2), (2, -2), (1, 4), (6, -1)]
+    for slot, delta in deltas:
+        store.apply(slot, delta)
+    expected = (store.drink_cups, store.addons_cups, store.sales, list(store.bucket_cups), list(store.bucket_sales))
+    store.recompute()
+    assert (store.drink_cups, store.addons_cups, store.sales, list(store.bucket_cups),
+            list(store.bucket_sales)) == expected
+    assert store.totals_of(store.counts) == (store.drink_cups, store.addons_cups, store.sales)
+
+
+def test_load_merge_and_reset(store):
+    store.load([1, 0, 2, 0, 0, 1, 1])
+    assert store.drink_cups == 4
+    store.merge(array("l", [0, 1, 1, 0, 0, 0, 2]))
+    assert list(store.counts) == [1, 1, 3, 0, 0, 1, 3]
+    assert store.sales == 9 + 15 + 3 * 49 + 59 + 3 * 39
+    store.reset()
+    assert not any(store.counts) and store.sales == 0
+
+
+def test_apply_many_returns_what_was_applied(store):
+    applied = store.apply_many([(6, 2), (6, -5), (0, 0), (2, 1)])
+    assert applied == [(6, 2), (6, -2), (2, 1)]
+
+
+def test_lookup_follows_aliases():
+    store = CountStore(small_catalog(), aliases={("Frappe", "PISTACHIO"): ("Praf", "PV")})
+    assert store.lookup("Praf", "PV") == {"medio": 4, "grande": 5}
+    assert store.lookup("Frappe", "PISTACHIO") == {"medio": 4, "grande": 5}
+    assert store.lookup("Frappe", "PCA") is None
+
+
+def test_report_rows(store):
+    store.load([1, 2, 3, 4, 0, 0, 5])
+    assert list(store.report_rows()) == [
+        ("Add Ons", "P", "", "", 1, 9),
+        ("Add Ons", "ES", "", "", 2, 30),
+        ("Praf", "PCA", 3, 4, "", 3 * 49 + 4 * 59),
+        ("Praf", "PV", 0, 0, "", 0),
+        ("Hot Brew", "HB", "", "", 5, 5 * 39),
+    ]
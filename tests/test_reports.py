@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pytest
+
+from reports import ReportError, ReportIndex, ReportSaver, read_report, report_time, write_report
+
+
+def test_report_round_trip(tmp_path, store):
+    store.load([1, 2, 3, 4, 0, 5, 6])
+    path = str(tmp_path / "cups_report_20261018_210000.csv")
+    write_report(path, store, store.counts)
+    counts, problems = read_report(path, store)
+    assert list(counts) == list(store.counts)
+    assert problems == []
+
+
+def test_unknown_and_malformed_rows_are_reported(tmp_path, store):
+    path = tmp_path / "report.csv"
+    path.write_text("Category,Product,Medio,Grande,Fixed,Sale\n"
+                    "Praf,PCA,2,x,,0\n"
+                    "Praf,NOPE,1,1,,0\n"
+                    "Hot Brew\n"
+                    "Hot Brew,HB,,,4,156\n")
+    counts, problems = read_report(str(path), store)
+    assert counts[store.slot("Hot Brew", "HB", "fixed")] == 4
+    assert counts[store.slot("Praf", "PCA", "medio")] == 0
+    assert len(problems) == 3
+    assert not any(store.counts)
+
+
+def test_unreadable_files_raise_report_error(tmp_path, store):
+    path = tmp_path / "report.csv"
+    path.write_bytes(b"\xff\xfe\x00bad")
+    with pytest.raises(ReportError):
+        read_report(str(path), store)
+    path.write_text("Name,Count\n")
+    with pytest.raises(ReportError, match="Missing column"):
+        read_report(str(path), store)
+
+
+def test_index_lists_saved_reports_newest_first(tmp_path, store):
+    store.load([0, 0, 2, 1, 0, 0, 3])
+    write_report(str(tmp_path / "cups_report_20261017_200000.csv"), store, store.counts)
+    (tmp_path / "notes.csv").write_text("x\n")
+    index = ReportIndex(str(tmp_path), store)
+    index.open()
+    store.load([0, 0, 1, 0, 0, 0, 0])
+    index.add(str(tmp_path / "cups_report_20261018_200000.csv"), store.counts)
+
+    reopened = ReportIndex(str(tmp_path), store)
+    reopened.open()
+    names = [name for name, _ in reopened.newest_first()]
+    assert names == ["cups_report_20261018_200000.csv", "cups_report_20261017_200000.csv"]
+    assert reopened.entries["cups_report_20261017_200000.csv"]["cups"] == 6
+    assert report_time(names[0]).day == 18
+
+
+def test_rescan_keeps_reports_added_while_it_runs(tmp_path, store, monkeypatch):
+    import reports
+
+    store.load([0, 0, 2, 1, 0, 0, 3])
+    old = str(tmp_path / "cups_report_20261017_200000.csv")
+    write_report(old, store, store.counts)
+    index = ReportIndex(str(tmp_path), store)
+    index.entries["cups_report_20261016_200000.csv"] = {"saved_at": "2026-10-16 20:00:00", "cups": 1,
+                                                        "addons": 0, "sales": 39}
+    new = str(tmp_path / "cups_report_20261018_200000.csv")
+    parse = reports.read_report
+
+    def read_during_save(path, store):
+        # A save finishes while the scan is still reading older reports
+        write_report(new, store, store.counts)
+        index.add(new, store.counts)
+        return parse(path, store)
+
+    monkeypatch.setattr(reports, "read_report", read_during_save)
+    index.rescan()
+    assert sorted(index.entries) == ["cups_report_20261017_200000.csv", "cups_report_20261018_200000.csv"]
+
+
+def test_rescan_keeps_reports_added_while_it_lists_the_directory(tmp_path, store, monkeypatch):
+    import glob
+
+    index = ReportIndex(str(tmp_path), store)
+    new = str(tmp_path / "cups_report_20261018_200000.csv")
+    listdir = glob.glob
+
+    def glob_during_save(pattern):
+        # The save is indexed after the directory was listed
+        found = listdir(pattern)
+        write_report(new, store, store.counts)
+        index.add(new, store.counts)
+        return found
+
+    monkeypatch.setattr(glob, "glob", glob_during_save)
+    index.rescan()
+    assert list(index.entries) == ["cups_report_20261018_200000.csv"]
+
+
+def wait_for(saver, done, count):
+    for _ in range(count):
+        assert done.acquire(timeout=5)
+    for _ in range(500):
+        if not saver._running:
+            return
+        time.sleep(0.01)
+    raise AssertionError("saver still running")
+
+
+def test_saver_reports_failures_and_keeps_working(tmp_path, store):
+    results = []
+    done = threading.Semaphore(0)
+
+    def on_done(path, error, meta):
+        results.append((path, error))
+        done.release()
+
+    def after_write(path, counts, meta):
+        if meta == "boom":
+            raise RuntimeError("history is broken")
+
+    saver = ReportSaver(store, on_done, after_write=after_write)
+    first = str(tmp_path / "first.csv")
+    assert saver.save(first, store.snapshot(), "boom")
+    wait_for(saver, done, 1)
+    assert isinstance(results[0][1], RuntimeError)
+
+    second = str(tmp_path / "second.csv")
+    assert saver.save(second, store.snapshot())
+    wait_for(saver, done, 1)
+    assert results[1] == (second, None)
+
+
+def test_saver_recovers_when_on_done_raises(tmp_path, store, monkeypatch):
+    calls = []
+    done = threading.Semaphore(0)
+    # The first worker thread dies with on_done's exception; keep it out of the test output
+    monkeypatch.setattr(threading, "excepthook", lambda args: done.release())
+
+    def on_done(path, error, meta):
+        calls.append(path)
+        if len(calls) == 1:
+            raise RuntimeError("popup failed")
+        done.release()
+
+    saver = ReportSaver(store, on_done)
+    saver.save(str(tmp_path / "a.csv"), store.snapshot())
+    wait_for(saver, done, 1)
+    assert saver.save(str(tmp_path / "b.csv"), store.snapshot())
+    wait_for(saver, done, 1)
+    assert len(calls) == 2
+
+
+def test_saver_queues_saves_of_different_files(tmp_path, store):
+    results = []
+    done = threading.Semaphore(0)
+    release = threading.Event()
+
+    def on_done(path, error, meta):
+        results.append((path, meta))
+        done.release()
+
+    def after_write(path, counts, meta):
+        release.wait(5)
+
+    saver = ReportSaver(store, on_done, after_write=after_write)
+    first, second, third = (str(tmp_path / name) for name in ("first.csv", "second.csv", "third.csv"))
+    assert saver.save(first, store.snapshot(), 1)
+    assert not saver.save(second, store.snapshot(), 2)
+    assert not saver.save(third, store.snapshot(), 3)
+    assert not saver.save(second, store.snapshot(), 4)
+    release.set()
+    wait_for(saver, done, 3)
+    assert results == [(first, 1), (second, 4), (third, 3)]
@@ -0,0 +1,101 @@
+import pytest
+
+from catalog import load_catalog
+from model import CountStore
+from shifts import ShiftLog, performance_text
+
+
+@pytest.fixture
+def store():
+    catalog = load_catalog()
+    return CountStore(catalog.categories, catalog.aliases)
+
+
+def sell(store, category, product, size, count):
+    store.apply(store.slot(category, product, size), count)
+
+
+def test_shift_figures_are_snapshot_differences(tmp_path, store):
+    log = ShiftLog(str(tmp_path / "shifts.bin"), store)
+    sell(store, "Praf", "PCA", "grande", 3)
+    sell(store, "Secret Menu", "BROWNIE", "fixed", 1)
+    sell(store, "Add Ons", "P", "fixed", 2)
+    first = log.handover("Ana", when=100.0)
+    assert first.figures == (4, 2, 0, 1, 1, 0)
+
+    sell(store, "Special Drinks", "SDBP", "fixed", 2)
+    sell(store, "Secret Menu", "CRAZY", "fixed", 1)
+    assert log.current("Ben").figures == (3, 0, 2, 1, 0, 1)
+    second = log.handover("Ben", when=200.0)
+    assert (second.started, second.ended) == (100.0, 200.0)
+    assert [s.cashier for s in log.shifts()] == ["Ana", "Ben"]
+    assert log.current().figures == (0, 0, 0, 0, 0, 0)
+
+
+def test_snapshots_survive_a_restart(tmp_path, store):
+    path = str(tmp_path / "shifts.bin")
+    log = ShiftLog(path, store)
+    sell(store, "Praf", "PCA", "medio", 2)
+    log.handover("Ana", when=100.0)
+    sell(store, "Praf", "PCA", "medio", 5)
+    log.handover("Bea", when=200.0)
+
+    reopened = ShiftLog(path, store)
+    reopened.open()
+    assert [(s.cashier, s.figures[0]) for s in reopened.shifts()] == [("Ana", 2), ("Bea", 5)]
+
+
+def test_torn_handover_is_dropped(tmp_path, store):
+    path = str(tmp_path / "shifts.bin")
+    log = ShiftLog(path, store)
+    log.handover("Ana", when=100.0)
+    log.handover("Bea", when=200.0)
+    with open(path, "r+b") as file:
+        file.truncate(file.seek(0, 2) - 3)
+
+    reopened = ShiftLog(path, store)
+    reopened.open()
+    assert [s.cashier for s in reopened.shifts()] == ["Ana"]
+
+
+def test_clear_forgets_every_shift(tmp_path, store):
+    path = tmp_path / "shifts.bin"
+    log = ShiftLog(str(path), store)
+    log.handover("Ana")
+    log.clear()
+    assert log.shifts() == [] and not path.exists()
+
+
+def test_performance_text_lists_every_shift(tmp_path, store):
+    log = ShiftLog(str(tmp_path / "shifts.bin"), store)
+    sell(store, "Praf", "PCA", "medio", 2)
+    log.handover("Ana")
+    sell(store, "Secret Menu", "CRAZY", "fixed", 1)
+    text = performance_text("Oct 18", log.shifts() + [log.current("Ben")])
+    assert text.startswith("CASHIER PERFORMANCE\nDATE: Oct 18")
+    assert "(2)\nCASHIER: Ana" in text
+    assert "(1)\nCASHIER: Ben" in text
+    assert text.endswith("CRAZY : 1")
+
+
+def test_snapshots_follow_the_catalog_when_it_changes(tmp_path, store):
+    path = str(tmp_path / "shifts.bin")
+    log = ShiftLog(path, store)
+    sell(store, "Praf", "PCA", "medio", 2)
+    sell(store, "Secret Menu", "CRAZY", "fixed", 1)
+    log.handover("Ana", when=100.0)
+
+    catalog = load_catalog()
+    categories = [spec for spec in catalog.categories if spec.name != "Brosty"]
+    smaller = CountStore(categories, catalog.aliases)
+    sell(smaller, "Praf", "PCA", "medio", 3)
+    sell(smaller, "Secret Menu", "CRAZY", "fixed", 1)
+    reopened = ShiftLog(path, smaller)
+    reopened.open()
+    assert reopened.shifts()[0].figures == (3, 0, 0, 1, 0, 1)
+    assert reopened.current().figures[0] == 1
+    reopened.handover("Bea", when=200.0)
+
+    again = ShiftLog(path, smaller)
+    again.open()
+    assert [s.cashier for s in again.shifts()] == ["Ana", "Bea"]
@@ -0,0 +1,134 @@
+import random
+
+from model import CountStore
+from sync import SEQ_GAP, CountSync
+
+from conftest import small_catalog
+
+
+def terminals(count):
+    stores = [CountStore(small_catalog()) for _ in range(count)]
+    return stores, [CountSync(store, device_id=i + 1) for i, store in enumerate(stores)]
+
+
+def tap(store, sync, slot, delta):
+    applied = store.apply(slot, delta)
+    if applied:
+        sync.record(slot, applied)
+
+
+def deliver(syncs, sender, packets, rng=None, loss=0.0):
+    for data in packets:
+        for receiver in syncs:
+            if receiver is not sender and not (rng and rng.random() < loss):
+                receiver.receive(data)
+
+
+def test_two_terminals_add_up():
+    stores, syncs = terminals(2)
+    tap(stores[0], syncs[0], 2, 3)
+    tap(stores[1], syncs[1], 2, 2)
+    tap(stores[1], syncs[1], 6, 1)
+    for sync in syncs:
+        deliver(syncs, sync, sync.packets())
+    for s in stores:
+        assert s.counts[2] == 5 and s.counts[6] == 1
+        assert s.sales == 5 * 49 + 39
+
+
+def test_duplicate_and_stale_packets_are_ignored():
+    stores, syncs = terminals(2)
+    tap(stores[0], syncs[0], 6, 1)
+    old = syncs[0].packets()
+    tap(stores[0], syncs[0], 6, 1)
+    new = syncs[0].packets()
+    deliver(syncs, syncs[0], new + old + new)
+    assert stores[1].counts[6] == 2
+
+
+def test_terminals_converge_despite_lost_and_reordered_packets():
+    rng = random.Random(7)
+    stores, syncs = terminals(3)
+    in_flight = []
+    for step in range(600):
+        i = rng.randrange(3)
+        tap(stores[i], syncs[i], rng.randrange(len(stores[i])), 1 if rng.random() < 0.8 else -1)
+        for sync in syncs:
+            in_flight.extend((sync, data) for data in sync.packets(full=step % 50 == 0))
+        rng.shuffle(in_flight)
+        keep = []
+        for sender, data in in_flight:
+            if rng.random() < 0.5:
+                keep.append((sender, data))
+            else:
+                deliver(syncs, sender, [data], rng, loss=0.3)
+        in_flight = keep
+    # Lossless full resends settle everything
+    for sync in syncs * 2:
+        deliver(syncs, sync, sync.packets(full=True))
+    assert list(stores[0].counts) == list(stores[1].counts) == list(stores[2].counts)
+    assert list(stores[0].counts) == list(syncs[0].shared_counts())
+    for s in stores:
+        assert min(s.counts) >= 0
+
+
+def test_taking_off_a_peer_count_is_shared():
+    stores, syncs = terminals(2)
+    tap(stores[0], syncs[0], 6, 2)
+    deliver(syncs, syncs[0], syncs[0].packets())
+    tap(stores[1], syncs[1], 6, -2)
+    deliver(syncs, syncs[1], syncs[1].packets())
+    assert stores[0].counts[6] == stores[1].counts[6] == 0
+
+
+def test_state_survives_a_restart(tmp_path):
+    stores, syncs = terminals(2)
+    tap(stores[0], syncs[0], 2, 4)
+    deliver(syncs, syncs[0], syncs[0].packets())
+    tap(stores[1], syncs[1], 2, 1)
+    path = str(tmp_path / "sync.state")
+    syncs[1].save(path)
+
+    restored = CountSync(CountStore(small_catalog()))
+    assert restored.load(path)
+    assert restored.device_id == syncs[1].device_id
+    assert restored.seq == syncs[1].seq + SEQ_GAP
+    assert list(restored.shared_counts()) == list(stores[1].counts)
+    assert not CountSync(CountStore(small_catalog())).load(str(tmp_path / "missing"))
+
+
+def test_state_follows_the_catalog_when_it_changes(tmp_path):
+    from model import CategorySpec
+
+    stores, syncs = terminals(2)
+    tap(stores[0], syncs[0], 6, 2)
+    deliver(syncs, syncs[0], syncs[0].packets())
+    tap(stores[1], syncs[1], 6, 1)
+    path = str(tmp_path / "sync.state")
+    syncs[1].save(path)
+
+    store = CountStore([CategorySpec("Hot Brew", ["HF", "HB"], kind="single", fixed_prices={"HB": 39, "HF": 41})])
+    restored = CountSync(store)
+    assert restored.load(path)
+    assert list(restored.shared_counts()) == [0, 3]
+    assert list(restored.own) == [0, 1]
+
+
+def test_starting_over_on_one_terminal_zeroes_the_shared_tally():
+    # What New Day does with sync on: the whole shared tally starts over
+    stores, syncs = terminals(2)
+    tap(stores[0], syncs[0], 2, 3)
+    tap(stores[1], syncs[1], 2, 4)
+    for sync in syncs:
+        deliver(syncs, sync, sync.packets())
+    before = stores[0].snapshot()
+    stores[0].reset()
+    syncs[0].record_changes(before, stores[0].counts)
+    deliver(syncs, syncs[0], syncs[0].packets())
+    assert stores[0].counts[2] == 0 and stores[1].counts[2] == 0
+
+    tap(stores[1], syncs[1], 2, 1)
+    tap(stores[0], syncs[0], 2, 2)
+    for sync in syncs:
+        deliver(syncs, sync, sync.packets())
+    assert stores[0].counts[2] == 3 and stores[1].counts[2] == 3
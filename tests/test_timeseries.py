@@ -0,0 +1,111 @@
+import time
+
+import pytest
+
+from timeseries import (TimeSeries, aggregate_hourly, bucket_labels, day_bounds, hourly_path, peaks, read_hourly,
+                        write_hourly)
+
+
+def at(hour, minute=0, day=18):
+    return time.mktime((2026, 10, day, hour, minute, 0, 0, 0, -1))
+
+
+def test_taps_land_in_their_time_of_day_bucket(store):
+    series = TimeSeries(store, interval=3600)
+    series._start_day(at(9))
+    series.record(2, 1, now=at(9, 15))
+    series.record(2, 1, now=at(9, 59))
+    series.record(6, 3, now=at(17, 30))
+    series.record(0, 1, now=at(17, 45))
+    assert series.buckets == 24
+    assert series.bucket_totals()[9] == 2
+    assert series.bucket_totals()[17] == 3
+    assert series.bucket_totals(addons=True)[17] == 1
+    assert peaks(series.bucket_totals()) == [17, 9]
+    rows = list(series.rows())
+    assert ("Praf", "PCA", "medio", [0] * 9 + [2] + [0] * 14) in rows
+
+
+def test_buckets_keep_their_day_past_midnight(store):
+    series = TimeSeries(store, interval=1800)
+    series._start_day(at(22))
+    series.record(6, 1, now=at(23, 40))
+    series.record(6, 1, now=at(0, 10, day=19))
+    assert series.day == day_bounds(at(12))[2]
+    totals = series.bucket_totals()
+    assert totals[47] == 1 and totals[0] == 1
+    series.clear()
+    assert not any(series.counts)
+
+
+def test_bucket_length_must_divide_a_day(store):
+    with pytest.raises(ValueError):
+        TimeSeries(store, interval=7000)
+    assert bucket_labels(21600) == ["00:00", "06:00", "12:00", "18:00"]
+
+
+def test_save_and_load_today(tmp_path, store):
+    path = str(tmp_path / "series.bin")
+    series = TimeSeries(store)
+    series.record(3, 2)
+    series.save(path)
+    restored = TimeSeries(store)
+    assert restored.load(path)
+    assert list(restored.counts) == list(series.counts)
+    assert not TimeSeries(store, interval=1800).load(path)
+
+
+def test_an_earlier_day_is_loaded_with_its_day(tmp_path, store):
+    path = str(tmp_path / "series.bin")
+    series = TimeSeries(store)
+    series._start_day(at(9, day=17))
+    series.record(2, 3, now=at(9, 30, day=17))
+    series.save(path)
+    restored = TimeSeries(store)
+    assert restored.load(path)
+    assert restored.day == 20261017 and restored.bucket_totals()[9] == 3
+
+
+def test_hourly_exports_roll_up_per_weekday(tmp_path, store):
+    series = TimeSeries(store)
+    series._start_day(at(8))
+    series.record(2, 2, now=at(8, 30))
+    series.record(0, 5, now=at(8, 30))
+    paths = []
+    for name in ("cups_report_20261016_210000.csv", "cups_report_20261018_210000.csv"):
+        path = hourly_path(str(tmp_path / name))
+        write_hourly(path, series, series.counts)
+        paths.append(path)
+    assert paths[0].endswith("cups_hourly_20261016_210000.csv")
+    interval, rows = read_hourly(paths[0])
+    assert interval == 3600 and len(rows) == 2
+
+    result = aggregate_hourly(paths, addons={"Add Ons"})
+    assert result["days"] == 2
+    assert result["totals"][8] == 4
+    # 16 Oct 2026 is a Friday, 18 Oct a Sunday
+    assert sorted(result["weekdays"]) == [4, 6]
+    assert result["skipped"] == []
+
+
+def test_unreadable_exports_are_skipped(tmp_path, store):
+    bad = tmp_path / "cups_hourly_20261018_210000.csv"
+    bad.write_text("not,an,export\n")
+    garbled = tmp_path / "cups_hourly_20261017_210000.csv"
+    garbled.write_bytes(b"Category,Product,Size,00:00\n\xff\xfe\x00\n")
+    result = aggregate_hourly([str(bad), str(garbled)])
+    assert result["skipped"] == [str(bad), str(garbled)] and result["interval"] is None
+
+
+def test_buckets_follow_the_catalog_when_it_changes(tmp_path, store):
+    from model import CategorySpec, CountStore
+
+    path = str(tmp_path / "series.bin")
+    series = TimeSeries(store)
+    series.record(store.slot("Hot Brew", "HB", "fixed"), 2)
+    series.save(path)
+
+    smaller = CountStore([CategorySpec("Hot Brew", ["HB"], kind="single", fixed_prices={"HB": 39})])
+    restored = TimeSeries(smaller)
+    assert restored.load(path)
+    assert sum(restored.bucket_totals()) == 2
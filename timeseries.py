@@ -0,0 +1,298 @@
+"""Counts per slot in fixed time-of-day buckets (hourly by default).
+
+The app keeps the current day's taps made on this terminal in one flat array
+and exports it next to every saved report as cups_hourly_YYYYMMDD_HHMMSS.csv.
+This module also rolls those exports up over many days:
+
+    python timeseries.py reports/ --weekday
+    python timeseries.py branch1/ branch2/ --category Praf --json
+"""
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+
+from journal import catalog_signature, pack_keys, remap, slot_map, unpack_keys
+from model import SIZES
+
+
+SERIES_NAME = "series.bin"
+HOURLY_NAME = re.compile(r"cups_hourly_(\d{8})_(\d{6})\.csv$")
+DAY = 86400
+WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+# File: magic, catalog signature, bucket length in seconds, the day as YYYYMMDD
+# and the slot keys (see journal.py), then the bucket-major counts array
+HEADER = struct.Struct("<4sIII")
+MAGIC = b"CUPT"
+
+
+def zeros(size):
+    return array("l", bytes(size * array("l").itemsize))
+
+
+def bucket_labels(interval):
+    return [f"{start // 3600:02d}:{start % 3600 // 60:02d}" for start in range(0, DAY, interval)]
+
+
+def day_bounds(now):
+    # Local midnight before ``now`` and after it, as timestamps, plus the day as YYYYMMDD
+    t = time.localtime(now)
+    start = time.mktime((t.tm_year, t.tm_mon, t.tm_mday, 0, 0, 0, 0, 0, -1))
+    end = time.mktime((t.tm_year, t.tm_mon, t.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+    return start, end, t.tm_year * 10000 + t.tm_mon * 100 + t.tm_mday
+
+
+class TimeSeries:
+    # Bucket-major: the count of ``slot`` in bucket ``b`` is counts[b * len(store) + slot].
+    # Recording a tap is a clock read, a range check and one array add. Like the
+    # tally it belongs to, a series keeps its day until ``clear`` starts a new one
+    # (New Day in the app); taps after midnight go to their time-of-day bucket.
+    def __init__(self, store, interval=3600):
+        if interval <= 0 or DAY % interval:
+            raise ValueError(f"bucket length must divide a day evenly, got {interval}s")
+        self.store = store
+        self.interval = interval
+        self.buckets = DAY // interval
+        self.size = len(store)
+        self.signature = catalog_signature(store)
+        self.dirty = False
+        self._start_day(time.time())
+
+    def _start_day(self, now):
+        self.day_start, self.day_end, self.day = day_bounds(now)
+        self.counts = zeros(self.buckets * self.size)
+
+    def clear(self):
+        self._start_day(time.time())
+        self.dirty = True
+
+    def record(self, slot, delta, now=None):
+        if now is None:
+            now = time.time()
+        if self.day_start <= now < self.day_end:
+            bucket = min(int((now - self.day_start) // self.interval), self.buckets - 1)
+        else:
+            t = time.localtime(now)
+            bucket = (t.tm_hour * 3600 + t.tm_min * 60 + t.tm_sec) // self.interval
+        self.counts[bucket * self.size + slot] += delta
+        self.dirty = True
+
+    def save(self, path):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(HEADER.pack(MAGIC, self.signature, self.interval, self.day))
+            file.write(pack_keys(self.store))
+            file.write(self.counts.tobytes())
+        os.replace(tmp_path, path)
+        self.dirty = False
+
+    def load(self, path):
+        # Restores buckets of the same length together with their day, which may
+        # be an earlier one; ones recorded under an earlier catalog are moved to
+        # the current slots
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except OSError:
+            return False
+        if len(data) < HEADER.size:
+            return False
+        magic, signature, interval, day = HEADER.unpack_from(data)
+        if (magic, interval) != (MAGIC, self.interval) or not day:
+            return False
+        keys, offset = unpack_keys(data, HEADER.size)
+        if keys is None or len(data) - offset != self.buckets * len(keys) * self.counts.itemsize:
+            return False
+        counts = array("l", data[offset:])
+        if signature != self.signature:
+            mapping = slot_map(self.store, keys)
+            moved = array("l")
+            for b in range(self.buckets):
+                moved += remap(counts[b * len(keys):(b + 1) * len(keys)], mapping, self.size)
+            counts = moved
+            self.dirty = True
+        self.day_start, self.day_end, self.day = day_bounds(
+            time.mktime((day // 10000, day // 100 % 100, day % 100, 12, 0, 0, 0, 0, -1)))
+        self.counts = counts
+        return True
+
+    def bucket_totals(self, counts=None, addons=False):
+        # Drink cups (or add-ons) per bucket
+        if counts is None:
+            counts = self.counts
+        wanted = [slot for slot in range(self.size) if bool(self.store.slot_addons[slot]) == addons]
+        totals = []
+        for b in range(self.buckets):
+            row = b * self.size
+            totals.append(sum(counts[row + slot] for slot in wanted))
+        return totals
+
+    def rows(self, counts=None):
+        # (category, product, size, [count per bucket]) for every slot sold in at least one bucket
+        if counts is None:
+            counts = self.counts
+        store = self.store
+        for slot in range(self.size):
+            values = counts[slot::self.size]
+            if any(values):
+                yield (store.categories[store.slot_category[slot]].name, store.slot_product[slot],
+                       SIZES[store.slot_size[slot]], list(values))
+
+
+def hourly_path(report_path):
+    # cups_report_20260318_173000.csv -> cups_hourly_20260318_173000.csv
+    directory, name = os.path.split(report_path)
+    return os.path.join(directory, name.replace("cups_report_", "cups_hourly_", 1))
+
+
+def write_hourly(path, series, counts):
+    import csv
+    tmp_path = path + ".tmp"
+    with open(tmp_path, mode="w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Category", "Product", "Size"] + bucket_labels(series.interval))
+        for category, product, size, values in series.rows(counts):
+            writer.writerow([category, product, size] + values)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def hourly_time(path):
+    from datetime import datetime
+    match = HOURLY_NAME.search(os.path.basename(path))
+    if not match:
+        return None
+    return datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+
+
+def read_hourly(path):
+    # Returns (bucket length in seconds, [(category, product, size, [counts]), ...]),
+    # or (None, []) when the file is not a readable export
+    import csv
+    try:
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            header = next(reader, None) or []
+            buckets = len(header) - 3
+            if header[:3] != ["Category", "Product", "Size"] or buckets <= 0 or DAY % buckets:
+                return None, []
+            rows = []
+            for row in reader:
+                if len(row) != len(header):
+                    continue
+                try:
+                    rows.append((row[0], row[1], row[2], [int(v) if v else 0 for v in row[3:]]))
+                except ValueError:
+                    continue
+    except (OSError, UnicodeDecodeError, csv.Error):
+        return None, []
+    return DAY // buckets, rows
+
+
+def find_hourly(paths):
+    import glob
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "cups_hourly_*.csv")))
+        else:
+            found.extend(glob.glob(path) or [path])
+    return sorted(p for p in set(found) if hourly_time(p))
+
+
+def aggregate_hourly(paths, category=None, addons=None):
+    # Sums drink cups per bucket over every file, overall and per weekday; with
+    # ``addons`` (a set of category names) those categories are left out. Files
+    # recorded with another bucket length than the first one are skipped.
+    interval = None
+    totals = None
+    weekdays = {}
+    days = set()
+    skipped = []
+    for path in paths:
+        file_interval, rows = read_hourly(path)
+        if file_interval is None or (interval is not None and file_interval != interval):
+            skipped.append(path)
+            continue
+        if interval is None:
+            interval = file_interval
+            totals = zeros(DAY // interval)
+        when = hourly_time(path)
+        days.add((os.path.dirname(os.path.abspath(path)), when.date()))
+        weekday = weekdays.get(when.weekday())
+        if weekday is None:
+            weekday = weekdays[when.weekday()] = zeros(len(totals))
+        for cat, product, size, values in rows:
+            if (category is not None and cat != category) or (addons and cat in addons):
+                continue
+            for b, count in enumerate(values):
+                if count:
+                    totals[b] += count
+                    weekday[b] += count
+    return {"interval": interval, "days": len(days), "totals": totals, "weekdays": weekdays, "skipped": skipped}
+
+
+def peaks(totals, count=3):
+    # Indexes of the busiest buckets, busiest first
+    return sorted((b for b in range(len(totals)) if totals[b]), key=lambda b: -totals[b])[:count]
+
+
+def bar_lines(totals, interval, width=30, mark="█"):
+    top = max(totals) if totals and max(totals) > 0 else 1
+    labels = bucket_labels(interval)
+    return [f"{labels[b]} {mark * max(1, totals[b] * width // top):<{width}} {totals[b]}"
+            for b in range(len(totals)) if totals[b]]
+
+
+def main(argv=None):
+    import argparse
+    import json
+    from aggregate import latest_per_day
+    from catalog import load_catalog
+
+    parser = argparse.ArgumentParser(description="Roll up cups_hourly_*.csv exports into busy-hour totals.")
+    parser.add_argument("paths", nargs="*", default=["."], help="export files, globs or directories")
+    parser.add_argument("--category", help="only this category")
+    parser.add_argument("--all-saves", action="store_true",
+                        help="sum every export instead of only the last one per day and directory")
+    parser.add_argument("--weekday", action="store_true", help="also break the totals down by weekday")
+    parser.add_argument("--catalog", help="catalog file (default: the bundled catalog.json)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of text")
+    args = parser.parse_args(argv)
+
+    paths = find_hourly(args.paths)
+    if not args.all_saves:
+        paths = latest_per_day(paths, when=hourly_time)
+    addons = {spec.name for spec in load_catalog(args.catalog).categories if spec.kind == "addons"}
+    result = aggregate_hourly(paths, args.category, addons)
+    for path in result["skipped"]:
+        sys.stderr.write(f"skipped {path}: different bucket length or not an hourly export\n")
+    if result["interval"] is None:
+        sys.stderr.write("no hourly exports found\n")
+        return
+    interval, totals, days = result["interval"], result["totals"], result["days"]
+    labels = bucket_labels(interval)
+    if args.json:
+        out = {"interval": interval, "days": days,
+               "totals": dict(zip(labels, totals)),
+               "per_day": {label: total / days for label, total in zip(labels, totals)},
+               "peaks": [labels[b] for b in peaks(totals)]}
+        if args.weekday:
+            out["weekdays"] = {WEEKDAYS[d]: dict(zip(labels, t)) for d, t in sorted(result["weekdays"].items())}
+        json.dump(out, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    print(f"{days} day(s), peaks: {', '.join(labels[b] for b in peaks(totals)) or 'none'}")
+    for line in bar_lines(totals, interval):
+        print(f"  {line}")
+    if args.weekday:
+        for d, t in sorted(result["weekdays"].items()):
+            print(f"{WEEKDAYS[d]}: peaks {', '.join(labels[b] for b in peaks(t)) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()